@@ -0,0 +1,61 @@
+import threading
+import time
+
+from zotify import auth
+from zotify.auth import AccessToken
+
+
+class CachingTokenSource:
+    """ Hands out its cached token until it is discarded, like librespot's TokenProvider """
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.issued = 0
+        self.current = None
+        self.fetched = threading.Event()
+
+    def fetch(self):
+        if self.current is None:
+            time.sleep(self.delay if self.issued else 0)
+            self.issued += 1
+            self.current = f'token{self.issued}'
+        self.fetched.set()
+        return self.current, 3600
+
+    def discard(self, access_token):
+        if access_token == self.current:
+            self.current = None
+
+
+def test_early_refresh_renews_the_token_in_the_background(monkeypatch):
+    # the first token is due for renewal right away
+    monkeypatch.setattr(auth, 'REFRESH_MARGIN', 3600)
+    source = CachingTokenSource(delay=0.5)
+    token = AccessToken(source.fetch, source.discard)
+    assert token.get() == 'token1'
+    monkeypatch.setattr(auth, 'REFRESH_MARGIN', 300)
+
+    source.fetched.clear()
+    time_start = time.monotonic()
+    # the renewal is slow, callers keep the old token meanwhile
+    assert token.get() == 'token1'
+    assert time.monotonic() - time_start < 0.2
+
+    assert source.fetched.wait(5)
+    deadline = time.monotonic() + 5
+    while token.get() != 'token2' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert token.get() == 'token2'
+    # the new token is not due for renewal for a long time
+    assert token.token[2] - time.monotonic() > 3000
+
+
+def test_invalidate_drops_only_the_rejected_token():
+    source = CachingTokenSource()
+    token = AccessToken(source.fetch, source.discard)
+    assert token.get() == 'token1'
+    token.invalidate('token1')
+    assert token.get() == 'token2'
+    # a late rejection of the old token keeps the new one
+    token.invalidate('token1')
+    assert token.get() == 'token2'
@@ -10,9 +10,7 @@ import sys
 import io
 from pathlib import Path
 
-from zotify.app import client
 from zotify.config import CONFIG_VALUES, Config
-from zotify.termoutput import Printer
 
 def main():
     # Ensure proper Unicode handling for input and output
@@ -37,6 +35,22 @@ def main():
     parser.add_argument('-v', '--verbose',
                         action='store_true',
                         help='Enable verbose output')
+    parser.add_argument('--offline-metadata',
+                        action='store_true',
+                        help='Serve all metadata from the local cache without logging in or touching the network.')
+    parser.add_argument('--serve',
+                        action='store_true',
+                        help='Stay logged in and run the jobs sent with --submit, on localhost port SERVE_PORT.')
+    parser.add_argument('--submit',
+                        action='store_true',
+                        help='Send the urls, -d, -l or -f download to a running --serve and show its progress.')
+    parser.add_argument('--priority',
+                        type=int,
+                        default=0,
+                        help='Priority of the --submit job, jobs with higher priorities download first.')
+    parser.add_argument('--status',
+                        action='store_true',
+                        help='Show how far the -d url files got and exit.')
     group = parser.add_mutually_exclusive_group(required=False)
     group.add_argument('urls',
                        type=str,
@@ -67,19 +81,15 @@ def main():
 
     for configkey in CONFIG_VALUES:
         parser.add_argument(CONFIG_VALUES[configkey]['arg'],
+                            dest=configkey.lower(),
                             type=str,
                             default=None,
                             help='Specify the value of the ['+configkey+'] config value')
 
-    parser.set_defaults(func=client)
-
     args = parser.parse_args()
     
     # Load configuration
     Config.load(args)
-    
-    # Set verbose mode
-    Printer.set_verbose_mode(args.verbose)
 
     # Handle the download option
     if args.download is not None:
@@ -100,6 +110,29 @@ def main():
             print(f"Error: No URLs found in the file '{args.download}'.")
             sys.exit(1)
 
+    if args.status:
+        from zotify.jobqueue import print_status
+        print_status(Config.get_job_queue_location())
+        return
+
+    if args.submit:
+        # the client only talks to the daemon, so it skips the imports of everything that downloads
+        from zotify.submit import submit
+        sys.exit(submit(args))
+
+    # we need to import that here, so that --submit starts quickly
+    from zotify.app import client
+    from zotify.daemon import serve
+    from zotify.termoutput import Printer, PrintChannel
+    from zotify.zotify import Zotify
+
+    # Set verbose mode
+    Printer.set_verbose_mode(args.verbose)
+
+    if args.serve:
+        serve(args)
+        return
+
     # If no URLs are provided, prompt the user for input
     if not args.urls and not args.liked_songs and not args.followed_artists and not args.playlist and not args.search:
         print("Enter Spotify URL or search query:")
@@ -109,10 +142,12 @@ def main():
         else:
             args.search = user_input
 
-    args.func(args)
+    client(args)
 
     # Print summary after download is complete
     Printer.print_summary()
+    if Zotify.METADATA_CACHE:
+        Printer.print(PrintChannel.DEBUG, Zotify.METADATA_CACHE.stats())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+from typing import Any, Coroutine
+from urllib.parse import urlsplit
+
+from zotify.config import Config
+from zotify.httpclient import HttpClient
+from zotify.ratelimit import parse_retry_after
+
+try:
+    import h2  # httpx needs it for HTTP/2
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class AsyncHttpClient:
+    """ HTTP/2 client on a private event loop thread, so blocking callers can overlap many small requests """
+    LOOP: asyncio.AbstractEventLoop = None
+    CLIENT = None
+    SEMAPHORE: asyncio.Semaphore = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        # replayed runs stay on the blocking client, which owns the replay transport
+        return Config.get_async_api() and httpx is not None and HttpClient.REPLAY is None
+
+    @classmethod
+    def get_loop(cls) -> asyncio.AbstractEventLoop:
+        if cls.LOOP is None:
+            with cls._lock:
+                if cls.LOOP is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='zotify-aio', daemon=True).start()
+                    asyncio.run_coroutine_threadsafe(cls._create_client(), loop).result()
+                    cls.LOOP = loop
+        return cls.LOOP
+
+    @classmethod
+    async def _create_client(cls) -> None:
+        pool_size = Config.get_http_pool_size()
+        cls.CLIENT = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(Config.get_http_read_timeout(), connect=Config.get_http_connect_timeout()),
+            follow_redirects=True,
+        )
+        cls.SEMAPHORE = asyncio.Semaphore(Config.get_async_api_concurrency())
+
+    @classmethod
+    def run(cls, coro: Coroutine) -> Any:
+        """ Runs coro on the client's event loop and blocks until it is done """
+        return asyncio.run_coroutine_threadsafe(coro, cls.get_loop()).result()
+
+    @classmethod
+    async def get(cls, url, **kwargs):
+        return await cls.request('GET', url, **kwargs)
+
+    @classmethod
+    async def request(cls, method, url, replayable=False, **kwargs):
+        # shares its per-host budgets with the blocking HttpClient
+        limiter = HttpClient.get_rate_limiter()
+        host = urlsplit(url).hostname
+        wait = limiter.reserve(host)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        async with cls.SEMAPHORE:
+            time_start = time.monotonic()
+            response = await cls.CLIENT.request(method, url, **kwargs)
+            elapsed = time.monotonic() - time_start
+        if replayable and HttpClient.RECORDER:
+            HttpClient.RECORDER.record(url, kwargs.get('params'), response)
+
+        # we need to import that here, otherwise we will get circular imports!
+        from zotify.termoutput import Printer, PrintChannel
+        Printer.print(PrintChannel.DEBUG, f'{response.http_version} {method} {host}{urlsplit(url).path} -> '
+                                          f'{response.status_code} in {elapsed * 1000:.0f} ms')
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if limiter.on_response(host, response.status_code, retry_after):
+            Printer.print(PrintChannel.WARNINGS, f'{host} answered {response.status_code}, slowing down requests'
+                          + (f' and pausing for {retry_after:.0f}s' if retry_after else ''))
+        return response
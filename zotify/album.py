@@ -1,6 +1,7 @@
 from zotify.const import ALBUM_URL, ALBUM, NAME, TRACKS, ITEMS, TOTAL, ID, RELEASE_DATE
-from zotify.track import download_track
+from zotify.track import prefetch_song_info
 from zotify.utils import fix_filename
+from zotify.workers import DownloadPool
 from zotify.termoutput import Printer, PrintChannel
 from zotify.zotify import Zotify
 from pathlib import Path
@@ -42,17 +43,19 @@ def download_album(album_id):
     Printer.print(PrintChannel.SKIPS, f"\nDownloading Album: {album_name}")
 
     tracks = get_album_tracks(album_id)
+    song_infos = prefetch_song_info([track[ID] for track in tracks])
     n = 1
-    for track in tracks:
-        download_track('album', track[ID], extra_keys={
-            'album_num': str(n).zfill(2),
-            'artist': artist,
-            'album': album_name,
-            'album_id': album_id,
-            'release_year': release_year,
-            'total_tracks': total_tracks
-        }, disable_progressbar=True)
-        n += 1
+    with DownloadPool() as pool:
+        for track in tracks:
+            pool.submit_track('album', track[ID], extra_keys={
+                'album_num': str(n).zfill(2),
+                'artist': artist,
+                'album': album_name,
+                'album_id': album_id,
+                'release_year': release_year,
+                'total_tracks': total_tracks
+            }, disable_progressbar=True, song_info=song_infos.get(track[ID]))
+            n += 1
 
 def download_artist_albums(artist_id):
     """ Downloads all of an artist's albums """
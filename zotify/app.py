@@ -6,18 +6,20 @@ from zotify.album import download_album, download_artist_albums
 from zotify.const import TRACK, NAME, ID, ARTIST, ARTISTS, ITEMS, TRACKS, EXPLICIT, ALBUM, ALBUMS, \
     OWNER, PLAYLIST, PLAYLISTS, DISPLAY_NAME, TYPE
 from zotify.loader import Loader
-from zotify.playlist import get_playlist_songs, get_playlist_info, download_from_user_playlist, download_playlist
+from zotify.playlist import get_playlist_songs, get_playlist_info, download_from_user_playlist, download_playlist, \
+    PlaylistSync
 from zotify.podcast import download_episode, get_show_episodes
 from zotify.termoutput import Printer, PrintChannel
-from zotify.track import download_track, get_saved_tracks, get_followed_artists
+from zotify.track import download_track, get_saved_tracks, get_followed_artists, prefetch_song_info
 from zotify.utils import splash, split_input, regex_input_for_urls
+from zotify.workers import DownloadPool
 from zotify.zotify import Zotify
 
 SEARCH_URL = 'https://api.spotify.com/v1/search'
 
 
-def client(args) -> None:
-    """ Connects to download server to perform query's and get songs to download """
+def connect(args) -> None:
+    """ Logs in and picks the download quality """
     Zotify(args)
 
     Printer.print(PrintChannel.SPLASH, splash())
@@ -30,6 +32,11 @@ def client(args) -> None:
     }
     Zotify.DOWNLOAD_QUALITY = quality_options[Zotify.CONFIG.get_download_quality()]
 
+
+def client(args) -> None:
+    """ Connects to download server to perform query's and get songs to download """
+    connect(args)
+
     if args.download:
         urls = []
         filename = args.download
@@ -37,7 +44,12 @@ def client(args) -> None:
             with open(filename, 'r', encoding='utf-8') as file:
                 urls.extend([line.strip() for line in file.readlines()])
 
-            download_from_urls(urls)
+            if Zotify.CONFIG.get_job_queue():
+                # we need to import that here, otherwise we will get circular imports!
+                from zotify.batch import download_batch
+                download_batch(filename, urls)
+            else:
+                download_from_urls(urls)
 
         else:
             Printer.print(PrintChannel.ERRORS, f'File {filename} not found.\n')
@@ -53,16 +65,11 @@ def client(args) -> None:
         return
 
     if args.liked_songs:
-        for song in get_saved_tracks():
-            if not song[TRACK][NAME] or not song[TRACK][ID]:
-                Printer.print(PrintChannel.SKIPS, '###   SKIPPING:  SONG DOES NOT EXIST ANYMORE   ###' + "\n")
-            else:
-                download_track('liked', song[TRACK][ID])
+        download_liked_songs()
         return
     
     if args.followed_artists:
-        for artist in get_followed_artists():
-            download_artist_albums(artist)
+        download_followed_artists()
         return
 
     if args.search:
@@ -82,51 +89,89 @@ def client(args) -> None:
             search_text = input('Enter search: ')
         search(search_text)
 
-def download_from_urls(urls: list[str]) -> bool:
-    """ Downloads from a list of urls """
+def download_liked_songs() -> None:
+    """ Downloads all the liked songs of the account """
+    saved_tracks = get_saved_tracks()
+    song_infos = prefetch_song_info([song[TRACK][ID] for song in saved_tracks])
+    with DownloadPool() as pool:
+        for song in saved_tracks:
+            if not song[TRACK][NAME] or not song[TRACK][ID]:
+                Printer.print(PrintChannel.SKIPS, '###   SKIPPING:  SONG DOES NOT EXIST ANYMORE   ###' + "\n")
+            else:
+                pool.submit_track('liked', song[TRACK][ID], song_info=song_infos.get(song[TRACK][ID]))
+
+
+def download_followed_artists() -> None:
+    """ Downloads all albums of the artists the account follows """
+    for artist in get_followed_artists():
+        download_artist_albums(artist)
+
+
+def download_from_urls(urls: list[str], on_url=None) -> bool:
+    """ Downloads from a list of urls, on_url is called with the index of every url before it is downloaded """
     download = False
 
-    for spotify_url in urls:
-        track_id, album_id, playlist_id, episode_id, show_id, artist_id = regex_input_for_urls(spotify_url)
-
-        if track_id is not None:
-            download = True
-            download_track('single', track_id)
-        elif artist_id is not None:
-            download = True
-            download_artist_albums(artist_id)
-        elif album_id is not None:
-            download = True
-            download_album(album_id)
-        elif playlist_id is not None:
-            download = True
-            playlist_songs = get_playlist_songs(playlist_id)
-            name, _ = get_playlist_info(playlist_id)
-            enum = 1
-            char_num = len(str(len(playlist_songs)))
-            for song in playlist_songs:
-                if not song[TRACK][NAME] or not song[TRACK][ID]:
-                    Printer.print(PrintChannel.SKIPS, '###   SKIPPING:  SONG DOES NOT EXIST ANYMORE   ###' + "\n")
-                else:
-                    if song[TRACK][TYPE] == "episode": # Playlist item is a podcast episode
-                        download_episode(song[TRACK][ID])
-                    else:
-                        download_track('playlist', song[TRACK][ID], extra_keys=
-                        {
-                            'playlist_song_name': song[TRACK][NAME],
-                            'playlist': name,
-                            'playlist_num': str(enum).zfill(char_num),
-                            'playlist_id': playlist_id,
-                            'playlist_track_id': song[TRACK][ID]
-                        })
-                    enum += 1
-        elif episode_id is not None:
-            download = True
-            download_episode(episode_id)
-        elif show_id is not None:
-            download = True
-            for episode in get_show_episodes(show_id):
-                download_episode(episode)
+    # resolve all single tracks up front so they cost one request per API_BATCH_SIZE tracks
+    song_infos = prefetch_song_info([regex_input_for_urls(spotify_url)[0] for spotify_url in urls])
+
+    # single tracks of the whole list share one batch, albums and playlists wait for their own tracks
+    with DownloadPool() as pool:
+        for index, spotify_url in enumerate(urls):
+            if on_url:
+                on_url(index)
+            track_id, album_id, playlist_id, episode_id, show_id, artist_id = regex_input_for_urls(spotify_url)
+
+            if track_id is not None:
+                download = True
+                pool.submit_track('single', track_id, song_info=song_infos.get(track_id))
+            elif artist_id is not None:
+                download = True
+                download_artist_albums(artist_id)
+            elif album_id is not None:
+                download = True
+                download_album(album_id)
+            elif playlist_id is not None:
+                download = True
+                name, _ = get_playlist_info(playlist_id)
+                sync = PlaylistSync(playlist_id)
+                if sync.is_unchanged(name):
+                    continue
+                playlist_songs = get_playlist_songs(playlist_id, use_cache=not sync.is_fresh_listing_needed())
+                track_ids = [song[TRACK][ID] for song in playlist_songs if song[TRACK] and song[TRACK][ID]]
+                sync.report(name, track_ids)
+                playlist_song_infos = prefetch_song_info([song[TRACK][ID] for song in playlist_songs
+                                                          if song[TRACK] and song[TRACK][TYPE] != "episode"
+                                                          and sync.is_new(song[TRACK][ID])])
+                # numbers are handed out here in playlist order, whichever worker finishes first
+                enum = 1
+                char_num = len(str(len(playlist_songs)))
+                with DownloadPool() as playlist_pool:
+                    for song in playlist_songs:
+                        if not song[TRACK][NAME] or not song[TRACK][ID]:
+                            Printer.print(PrintChannel.SKIPS, '###   SKIPPING:  SONG DOES NOT EXIST ANYMORE   ###' + "\n")
+                        else:
+                            if not sync.is_new(song[TRACK][ID]): # Already synced, only counts towards the numbering
+                                pass
+                            elif song[TRACK][TYPE] == "episode": # Playlist item is a podcast episode
+                                playlist_pool.submit(download_episode, song[TRACK][ID])
+                            else:
+                                playlist_pool.submit_track('playlist', song[TRACK][ID], extra_keys=
+                                {
+                                    'playlist_song_name': song[TRACK][NAME],
+                                    'playlist': name,
+                                    'playlist_num': str(enum).zfill(char_num),
+                                    'playlist_id': playlist_id,
+                                    'playlist_track_id': song[TRACK][ID]
+                                }, song_info=playlist_song_infos.get(song[TRACK][ID]))
+                            enum += 1
+                sync.commit(track_ids)
+            elif episode_id is not None:
+                download = True
+                pool.submit(download_episode, episode_id)
+            elif show_id is not None:
+                download = True
+                for episode in get_show_episodes(show_id):
+                    pool.submit(download_episode, episode)
 
     return download
 
@@ -0,0 +1,106 @@
+import atexit
+import datetime
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Set, Tuple
+
+from zotify.zotify import Zotify
+
+# added songs are committed in groups of this many, or this many seconds after the first song of a group
+COMMIT_SIZE = 100
+COMMIT_INTERVAL = 2
+
+
+class SongArchive:
+    """ SQLite store of every song downloaded for SKIP_PREVIOUSLY_DOWNLOADED, next to the tab separated
+        SONG_ARCHIVE file it imports. The ids are loaded into a set once per run """
+    ARCHIVE: 'SongArchive' = None
+    _lock = threading.Lock()
+
+    def __init__(self, tsv_path):
+        self.tsv_path = Path(tsv_path)
+        self.lock = threading.Lock()
+        self.pending: List[Tuple[str, str, str, str, str]] = []
+        self.timer = None
+        self.db = sqlite3.connect(f'{tsv_path}.db', check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS songs ('
+                        'id TEXT PRIMARY KEY, downloaded TEXT, artist TEXT, name TEXT, filename TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS imported (path TEXT PRIMARY KEY, offset INTEGER NOT NULL)')
+        self.db.commit()
+        self.import_tsv()
+        self.ids: Set[str] = {song_id for song_id, in self.db.execute('SELECT id FROM songs')}
+
+    @classmethod
+    def get_archive(cls) -> 'SongArchive':
+        if cls.ARCHIVE is None:
+            with cls._lock:
+                if cls.ARCHIVE is None:
+                    cls.ARCHIVE = SongArchive(Zotify.CONFIG.get_song_archive())
+                    atexit.register(cls.ARCHIVE.close)
+        return cls.ARCHIVE
+
+    def import_tsv(self) -> None:
+        """ Imports the lines the tab separated archive got since the last import, which older versions append to """
+        if not self.tsv_path.is_file():
+            return
+        path = str(self.tsv_path.resolve())
+        row = self.db.execute('SELECT offset FROM imported WHERE path = ?', (path,)).fetchone()
+        offset = row[0] if row else 0
+        size = self.tsv_path.stat().st_size
+        if size == offset:
+            return
+        if size < offset:
+            # the file was replaced, songs that were imported already are ignored
+            offset = 0
+        with open(self.tsv_path, 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+        # a line that is still being written is imported by the next run
+        end = data.rfind(b'\n') + 1
+        songs = []
+        for line in data[:end].decode('utf-8', errors='replace').splitlines():
+            fields = [field.strip() for field in line.split('\t')]
+            if fields[0]:
+                songs.append(tuple((fields + [''] * 5)[:5]))
+        with self.db:
+            self.db.executemany('INSERT OR IGNORE INTO songs (id, downloaded, artist, name, filename) '
+                                'VALUES (?, ?, ?, ?, ?)', songs)
+            self.db.execute('INSERT OR REPLACE INTO imported (path, offset) VALUES (?, ?)', (path, offset + end))
+
+    def __contains__(self, song_id: str) -> bool:
+        return song_id in self.ids
+
+    def add(self, song_id: str, filename: str, author_name: str, song_name: str) -> None:
+        with self.lock:
+            self.ids.add(song_id)
+            self.pending.append((song_id, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), author_name,
+                                 song_name, filename))
+            if len(self.pending) >= COMMIT_SIZE:
+                self._commit()
+            elif self.timer is None:
+                self.timer = threading.Timer(COMMIT_INTERVAL, self.commit)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def commit(self) -> None:
+        with self.lock:
+            self._commit()
+
+    def _commit(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO songs (id, downloaded, artist, name, filename) '
+                                'VALUES (?, ?, ?, ?, ?)', self.pending)
+        self.pending = []
+
+    def close(self) -> None:
+        with self.lock:
+            self._commit()
+            self.db.close()
@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+# seconds before expiry at which the token is renewed in the background
+REFRESH_MARGIN = 300
+# seconds before expiry at which a token is no longer handed out at all
+EXPIRY_MARGIN = 15
+
+
+class AccessToken:
+    """ Caches a bearer token with its expiry and renews it before callers ever have to wait """
+
+    def __init__(self, fetch_token: Callable[[], Tuple[str, float]],
+                 discard_token: Optional[Callable[[str], None]] = None):
+        # fetch_token returns the access token and its remaining lifetime in seconds,
+        # discard_token makes the token source forget a token the API has rejected
+        self.fetch_token = fetch_token
+        self.discard_token = discard_token
+        self.refresh_lock = threading.Lock()
+        # (access_token, expires_at, refresh_at) on the monotonic clock, replaced as a whole
+        # so readers never need the lock
+        self.token = None
+
+    def get(self) -> str:
+        token = self.token
+        now = time.monotonic()
+        if token is not None and now < token[1]:
+            if now >= token[2]:
+                self._refresh_in_background()
+            return token[0]
+        return self._refresh()
+
+    def invalidate(self, access_token: str) -> None:
+        """ Drops access_token after the API rejected it, the next get fetches a new one """
+        with self.refresh_lock:
+            token = self.token
+            # several requests can fail with the same token, only the first one drops it
+            if token is None or token[0] != access_token:
+                return
+            if self.discard_token:
+                self.discard_token(access_token)
+            self.token = None
+
+    def _refresh(self) -> str:
+        # callers arriving during a refresh wait for it and reuse its result
+        with self.refresh_lock:
+            token = self.token
+            if token is not None and time.monotonic() < token[1]:
+                return token[0]
+            return self._update()
+
+    def _refresh_in_background(self) -> None:
+        if not self.refresh_lock.acquire(blocking=False):
+            return
+
+        def refresh():
+            try:
+                token = self.token
+                if token is not None and self.discard_token:
+                    # the token source keeps handing out its cached token until shortly before it expires,
+                    # so it is made to forget it and renew it now
+                    self.discard_token(token[0])
+                self._update()
+            except Exception:
+                # the token is still valid, the next caller past refresh_at tries again
+                pass
+            finally:
+                self.refresh_lock.release()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _update(self) -> str:
+        access_token, expires_in = self.fetch_token()
+        now = time.monotonic()
+        expires_at = now + expires_in - EXPIRY_MARGIN
+        refresh_at = now + expires_in - REFRESH_MARGIN
+        if self.token is not None and self.token[0] == access_token:
+            # the token source handed back its own cached token, it only renews it
+            # close to expiry so there is no point asking again before then
+            refresh_at = expires_at
+        self.token = (access_token, expires_at, refresh_at)
+        return access_token
@@ -0,0 +1,157 @@
+import inspect
+from pathlib import Path
+from typing import Callable, Dict, List, Set, Tuple
+
+from zotify.app import download_from_urls
+from zotify.const import API_BATCH_SIZE
+from zotify.jobqueue import JobQueue
+from zotify.podcast import download_episode
+from zotify.scheduler import Container, schedule
+from zotify.termoutput import Printer, PrintChannel
+from zotify.track import TrackDownload, download_track
+from zotify.workers import DownloadPool
+from zotify.zotify import Zotify
+
+# the jobs a url may expand into, by the function the download code submits them with
+QUEUEABLE = {download_track: 'track', download_episode: 'episode'}
+
+
+class QueuedTrackDownload(TrackDownload):
+    """ TrackDownload that records every stage it reaches in the JobQueue """
+
+    def __init__(self, queue: JobQueue, job_id: int, **arguments):
+        super().__init__(**arguments)
+        self.queue = queue
+        self.job_id = job_id
+        self.failed = False
+
+    def download(self) -> bool:
+        self.queue.set_state(self.job_id, 'streaming')
+        return super().download()
+
+    def convert(self) -> bool:
+        self.queue.set_state(self.job_id, 'converting')
+        return super().convert()
+
+    def fail(self, e: Exception) -> None:
+        self.failed = True
+        self.queue.set_state(self.job_id, 'failed', str(e))
+        super().fail(e)
+
+    def finish(self) -> None:
+        super().finish()
+        # skipped tracks are done as well
+        if not self.failed:
+            self.queue.set_state(self.job_id, 'done')
+
+
+def download_queued_episode(queue: JobQueue, job_id: int, episode_id: str) -> None:
+    queue.set_state(job_id, 'streaming')
+    try:
+        download_episode(episode_id)
+    except Exception as e:
+        queue.set_state(job_id, 'failed', str(e))
+        Printer.print(PrintChannel.ERRORS, f'###   ERROR: Episode {episode_id} failed: {e}   ###')
+        return
+    queue.set_state(job_id, 'done')
+
+
+def record_jobs(items: List[Tuple[int, str]]) -> Tuple[List[Tuple[int, str, dict]], Dict[int, List[Callable[[], None]]]]:
+    """ Resolves the urls of items into the (item id, kind, arguments) of the tracks and episodes they contain,
+        returned with the callbacks of every item that wait until its jobs are done """
+    # where the jobs and the deferred callbacks of every url start in recorded
+    starts = []
+    deferred_starts = []
+
+    def on_url(_):
+        starts.append(len(recorded))
+        deferred_starts.append(len(recorded.deferred))
+
+    with DownloadPool.recording() as recorded:
+        download_from_urls([url for _, url in items], on_url=on_url)
+
+    jobs = []
+    for (item_id, _), start, end in zip(items, starts, starts[1:] + [len(recorded)]):
+        for fn, args, kwargs in recorded[start:end]:
+            if fn not in QUEUEABLE:
+                raise ValueError(f'{fn.__name__} can not be queued')
+            jobs.append((item_id, QUEUEABLE[fn], dict(inspect.signature(fn).bind(*args, **kwargs).arguments)))
+    deferred = {}
+    for (item_id, _), start, end in zip(items, deferred_starts, deferred_starts[1:] + [len(recorded.deferred)]):
+        if end > start:
+            deferred[item_id] = recorded.deferred[start:end]
+    return jobs, deferred
+
+
+def expand_urls(queue: JobQueue, batch: int, items: List[Tuple[int, str]]) -> Dict[int, List[Callable[[], None]]]:
+    """ Resolves albums, playlists, artists and shows of items into the tracks and episodes they contain.
+        Returns the callbacks, like storing a playlist snapshot, that wait until the jobs of their item are done """
+    try:
+        jobs, deferred = record_jobs(items)
+    except Exception as e:
+        if len(items) > 1:
+            # one url that can not be resolved must not hold back the others, so they are expanded one by one
+            deferred = {}
+            for item in items:
+                deferred.update(expand_urls(queue, batch, [item]))
+            return deferred
+        item_id, url = items[0]
+        queue.fail_item(item_id, str(e))
+        Printer.print(PrintChannel.ERRORS, f'###   ERROR: {url} could not be expanded: {e}   ###')
+        return {}
+    queue.expand(batch, [item_id for item_id, _ in items], jobs)
+    return deferred
+
+
+def run_finished_deferred(queue: JobQueue, deferred: Dict[int, List[Callable[[], None]]]) -> None:
+    """ Runs the callbacks of every item whose jobs are all done """
+    for item_id in [item_id for item_id in deferred if queue.is_item_done(item_id)]:
+        for fn in deferred.pop(item_id):
+            fn()
+
+
+def run_queued_jobs(queue: JobQueue, batch: int, tried: Set[int]) -> None:
+    """ Downloads every job of batch that still has to run and was not tried by this run yet, the urls they came
+        from take turns by SCHEDULING_POLICY """
+    containers = {}
+    for job in queue.get_jobs(batch, tried):
+        containers.setdefault(job[1], []).append(job)
+    if not containers:
+        return
+    with DownloadPool() as pool:
+        jobs = schedule([(Container(str(item_id), size=len(jobs)), jobs) for item_id, jobs in containers.items()],
+                        Zotify.CONFIG.get_scheduling_policy())
+        for job_id, _, kind, arguments in jobs:
+            tried.add(job_id)
+            if kind == 'track':
+                pool.submit_job(QueuedTrackDownload(queue, job_id, **arguments))
+            else:
+                pool.submit(download_queued_episode, queue, job_id, **arguments)
+
+
+def download_batch(filename: str, urls: List[str]) -> None:
+    """ Downloads the urls of a url file through the JobQueue. A run that was interrupted continues where it
+        stopped, a run that completed starts over so the file can be synced again """
+    queue = JobQueue(Zotify.CONFIG.get_job_queue_location())
+    batch = queue.open_batch(str(Path(filename).resolve()), [url for url in urls if url])
+    # tracks and urls failing in this run are retried by the next one
+    tried = set()
+    tried_items = set()
+    # playlist snapshots of urls expanded by this run, stored once their tracks are through. An interrupted run
+    # drops them, the next sync of the playlist then compares with its older snapshot
+    deferred = {}
+    try:
+        while True:
+            # whatever an earlier run or the last expansion left to do runs before more urls are resolved
+            run_queued_jobs(queue, batch, tried)
+            run_finished_deferred(queue, deferred)
+            items = queue.get_unexpanded(batch, API_BATCH_SIZE, tried_items)
+            if not items:
+                break
+            tried_items.update(item_id for item_id, _ in items)
+            deferred.update(expand_urls(queue, batch, items))
+    except KeyboardInterrupt:
+        Printer.print(PrintChannel.WARNINGS, '\n###   INTERRUPTED: run the same url file again to continue where it '
+                                             'stopped   ###')
+    finally:
+        queue.close()
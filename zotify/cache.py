@@ -0,0 +1,118 @@
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# first matching path pattern wins, None means the entry never expires
+CACHE_TTLS = (
+    (re.compile(r'/color-lyrics/'), None),
+    (re.compile(r'^/pathfinder/'), 10 * MINUTE),
+    (re.compile(r'^/v1/artists/[^/]+/albums'), DAY),
+    (re.compile(r'^/v1/(tracks|albums|audio-features|episodes)'), 30 * DAY),
+    (re.compile(r'^/v1/artists'), 7 * DAY),
+    (re.compile(r'^/v1/playlists'), 10 * MINUTE),
+    (re.compile(r'^/v1/me/'), 5 * MINUTE),
+)
+DEFAULT_TTL = DAY
+
+# when the cache outgrows its limit it is trimmed down to this fraction of it
+EVICTION_TARGET = 0.9
+
+
+def get_ttl(url: str) -> Optional[int]:
+    """ Returns how many seconds a response from url stays valid """
+    path = urlsplit(url).path
+    for pattern, ttl in CACHE_TTLS:
+        if pattern.search(path):
+            return ttl
+    return DEFAULT_TTL
+
+
+def normalize_url(url: str, params: Optional[dict] = None, language: str = '') -> str:
+    """ Builds a cache key that does not depend on query parameter order """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(str(k), str(v)) for k, v in params.items()]
+    normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(sorted(query)), ''))
+    return f'{language}|{normalized}'
+
+
+class MetadataCache:
+    """ SQLite backed, size bounded LRU cache of Web API response bodies """
+
+    def __init__(self, location, max_size_mb: int):
+        Path(location).parent.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db = sqlite3.connect(str(location), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                        'key TEXT PRIMARY KEY, body TEXT NOT NULL, size INTEGER NOT NULL, '
+                        'expires REAL, accessed REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.db.commit()
+        self.size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, key: str, allow_expired: bool = False) -> Optional[str]:
+        """ Returns the cached body for key, or None if it is missing or expired """
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT body, expires FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or (not allow_expired and row[1] is not None and row[1] < now):
+                self.misses += 1
+                return None
+            self.db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self.db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, url: str, body: str) -> None:
+        ttl = get_ttl(url)
+        now = time.time()
+        size = len(body.encode('utf-8'))
+        if size > self.max_size:
+            return
+        with self.lock:
+            old = self.db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self.db.execute('INSERT OR REPLACE INTO responses (key, body, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+                            (key, body, size, None if ttl is None else now + ttl, now))
+            self.size += size - (old[0] if old else 0)
+            if self.size > self.max_size:
+                self._evict()
+            self.db.commit()
+
+    def _evict(self) -> None:
+        """ Drops expired entries, then least recently used ones, until the cache fits again """
+        self.evictions += self.db.execute('DELETE FROM responses WHERE expires IS NOT NULL AND expires < ?',
+                                          (time.time(),)).rowcount
+        self.size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        target = self.max_size * EVICTION_TARGET
+        rows = self.db.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall()
+        stale = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            stale.append((key,))
+            self.size -= size
+        self.db.executemany('DELETE FROM responses WHERE key = ?', stale)
+        self.evictions += len(stale)
+
+    def stats(self) -> str:
+        return (f'Metadata cache: {self.hits} hits, {self.misses} misses, {self.evictions} evictions, '
+                f'{self.size / 1024 / 1024:.1f}MB used')
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
@@ -3,6 +3,8 @@ import sys
 from pathlib import Path, PurePath
 from typing import Any
 
+from zotify.transcode import get_available_cores
+
 
 ROOT_PATH = 'ROOT_PATH'
 ROOT_PODCAST_PATH = 'ROOT_PODCAST_PATH'
@@ -14,6 +16,26 @@ OVERRIDE_AUTO_WAIT = 'OVERRIDE_AUTO_WAIT'
 CHUNK_SIZE = 'CHUNK_SIZE'
 SPLIT_ALBUM_DISCS = 'SPLIT_ALBUM_DISCS'
 DOWNLOAD_REAL_TIME = 'DOWNLOAD_REAL_TIME'
+DOWNLOAD_WORKERS = 'DOWNLOAD_WORKERS'
+DOWNLOAD_PIPELINE = 'DOWNLOAD_PIPELINE'
+PREPARE_WORKERS = 'PREPARE_WORKERS'
+POSTPROCESS_WORKERS = 'POSTPROCESS_WORKERS'
+PIPELINE_QUEUE_SIZE = 'PIPELINE_QUEUE_SIZE'
+TRANSCODE_WORKERS = 'TRANSCODE_WORKERS'
+STREAM_STALL_TIMEOUT = 'STREAM_STALL_TIMEOUT'
+MIN_STREAM_THROUGHPUT = 'MIN_STREAM_THROUGHPUT'
+STREAM_RETRIES = 'STREAM_RETRIES'
+STREAM_TRANSCODE = 'STREAM_TRANSCODE'
+DOWNLOAD_SEGMENTS = 'DOWNLOAD_SEGMENTS'
+BANDWIDTH_LIMIT = 'BANDWIDTH_LIMIT'
+BANDWIDTH_BURST = 'BANDWIDTH_BURST'
+CREDENTIALS_POOL = 'CREDENTIALS_POOL'
+SERVE_PORT = 'SERVE_PORT'
+SERVE_TOKEN_LOCATION = 'SERVE_TOKEN_LOCATION'
+JOB_QUEUE = 'JOB_QUEUE'
+JOB_QUEUE_LOCATION = 'JOB_QUEUE_LOCATION'
+SCHEDULING_POLICY = 'SCHEDULING_POLICY'
+SERVE_JOBS = 'SERVE_JOBS'
 LANGUAGE = 'LANGUAGE'
 DOWNLOAD_QUALITY = 'DOWNLOAD_QUALITY'
 TRANSCODE_BITRATE = 'TRANSCODE_BITRATE'
@@ -37,6 +59,24 @@ RETRY_ATTEMPTS = 'RETRY_ATTEMPTS'
 CONFIG_VERSION = 'CONFIG_VERSION'
 DOWNLOAD_LYRICS = 'DOWNLOAD_LYRICS'
 SYNC_LYRICS_ONLY_MODE = 'SYNC_LYRICS_ONLY_MODE'
+PRINT_DEBUG = 'PRINT_DEBUG'
+HTTP_POOL_SIZE = 'HTTP_POOL_SIZE'
+HTTP_CONNECT_TIMEOUT = 'HTTP_CONNECT_TIMEOUT'
+HTTP_READ_TIMEOUT = 'HTTP_READ_TIMEOUT'
+METADATA_CACHE = 'METADATA_CACHE'
+METADATA_CACHE_LOCATION = 'METADATA_CACHE_LOCATION'
+METADATA_CACHE_SIZE = 'METADATA_CACHE_SIZE'
+API_RATE_LIMIT = 'API_RATE_LIMIT'
+PAGINATION_WINDOW = 'PAGINATION_WINDOW'
+ASYNC_API = 'ASYNC_API'
+ASYNC_API_CONCURRENCY = 'ASYNC_API_CONCURRENCY'
+INCREMENTAL_PLAYLIST_SYNC = 'INCREMENTAL_PLAYLIST_SYNC'
+API_RECORD_DIR = 'API_RECORD_DIR'
+API_REPLAY_DIR = 'API_REPLAY_DIR'
+REPLAY_LATENCY = 'REPLAY_LATENCY'
+REPLAY_RATE_LIMIT_PERCENT = 'REPLAY_RATE_LIMIT_PERCENT'
+REPLAY_ERROR_PERCENT = 'REPLAY_ERROR_PERCENT'
+REPLAY_SEED = 'REPLAY_SEED'
 
 # New configuration options
 SINGLE_TRACK_FOLDER = 'SINGLE_TRACK_FOLDER'
@@ -74,6 +114,26 @@ CONFIG_VALUES = {
     OVERRIDE_AUTO_WAIT:         { 'default': 'False', 'type': bool, 'arg': '--override-auto-wait'         },
     CHUNK_SIZE:                 { 'default': '20000', 'type': int,  'arg': '--chunk-size'                 },
     DOWNLOAD_REAL_TIME:         { 'default': 'False', 'type': bool, 'arg': '--download-real-time'         },
+    DOWNLOAD_WORKERS:           { 'default': '1',     'type': int,  'arg': '--workers'                    },
+    DOWNLOAD_PIPELINE:          { 'default': 'False', 'type': bool, 'arg': '--download-pipeline'          },
+    PREPARE_WORKERS:            { 'default': '2',     'type': int,  'arg': '--prepare-workers'            },
+    POSTPROCESS_WORKERS:        { 'default': '2',     'type': int,  'arg': '--postprocess-workers'        },
+    PIPELINE_QUEUE_SIZE:        { 'default': '4',     'type': int,  'arg': '--pipeline-queue-size'        },
+    TRANSCODE_WORKERS:          { 'default': '0',     'type': int,  'arg': '--transcode-workers'          },
+    STREAM_STALL_TIMEOUT:       { 'default': '30',    'type': int,  'arg': '--stream-stall-timeout'       },
+    MIN_STREAM_THROUGHPUT:      { 'default': '8',     'type': int,  'arg': '--min-stream-throughput'      },
+    STREAM_RETRIES:             { 'default': '2',     'type': int,  'arg': '--stream-retries'             },
+    STREAM_TRANSCODE:           { 'default': 'False', 'type': bool, 'arg': '--stream-transcode'           },
+    DOWNLOAD_SEGMENTS:          { 'default': '4',     'type': int,  'arg': '--download-segments'          },
+    BANDWIDTH_LIMIT:            { 'default': '0',     'type': str,  'arg': '--bandwidth-limit'            },
+    BANDWIDTH_BURST:            { 'default': '2',     'type': int,  'arg': '--bandwidth-burst'            },
+    CREDENTIALS_POOL:           { 'default': '',      'type': str,  'arg': '--credentials-pool'           },
+    SERVE_PORT:                 { 'default': '7390',  'type': int,  'arg': '--serve-port'                 },
+    SERVE_TOKEN_LOCATION:       { 'default': '',      'type': str,  'arg': '--serve-token-location'       },
+    JOB_QUEUE:                  { 'default': 'True',  'type': bool, 'arg': '--job-queue'                  },
+    JOB_QUEUE_LOCATION:         { 'default': '',      'type': str,  'arg': '--job-queue-location'         },
+    SCHEDULING_POLICY:          { 'default': 'round-robin', 'type': str, 'arg': '--scheduling-policy'     },
+    SERVE_JOBS:                 { 'default': '2',     'type': int,  'arg': '--serve-jobs'                 },
     LANGUAGE:                   { 'default': 'en',    'type': str,  'arg': '--language'                   },
     PRINT_SPLASH:               { 'default': 'False', 'type': bool, 'arg': '--print-splash'               },
     PRINT_SKIPS:                { 'default': 'True',  'type': bool, 'arg': '--print-skips'                },
@@ -83,6 +143,24 @@ CONFIG_VALUES = {
     PRINT_API_ERRORS:           { 'default': 'True',  'type': bool, 'arg': '--print-api-errors'           },
     PRINT_PROGRESS_INFO:        { 'default': 'True',  'type': bool, 'arg': '--print-progress-info'        },
     PRINT_WARNINGS:             { 'default': 'True',  'type': bool, 'arg': '--print-warnings'             },
+    PRINT_DEBUG:                { 'default': 'False', 'type': bool, 'arg': '--print-debug'                },
+    HTTP_POOL_SIZE:             { 'default': '10',    'type': int,  'arg': '--http-pool-size'             },
+    HTTP_CONNECT_TIMEOUT:       { 'default': '10',    'type': int,  'arg': '--http-connect-timeout'       },
+    HTTP_READ_TIMEOUT:          { 'default': '30',    'type': int,  'arg': '--http-read-timeout'          },
+    METADATA_CACHE:             { 'default': 'False', 'type': bool, 'arg': '--metadata-cache'             },
+    METADATA_CACHE_LOCATION:    { 'default': '',      'type': str,  'arg': '--metadata-cache-location'    },
+    METADATA_CACHE_SIZE:        { 'default': '256',   'type': int,  'arg': '--metadata-cache-size'        },
+    API_RATE_LIMIT:             { 'default': '10',    'type': int,  'arg': '--api-rate-limit'             },
+    PAGINATION_WINDOW:          { 'default': '8',     'type': int,  'arg': '--pagination-window'          },
+    ASYNC_API:                  { 'default': 'False', 'type': bool, 'arg': '--async-api'                  },
+    ASYNC_API_CONCURRENCY:      { 'default': '32',    'type': int,  'arg': '--async-api-concurrency'      },
+    INCREMENTAL_PLAYLIST_SYNC:  { 'default': 'False', 'type': bool, 'arg': '--incremental-playlist-sync'  },
+    API_RECORD_DIR:             { 'default': '',      'type': str,  'arg': '--api-record-dir'             },
+    API_REPLAY_DIR:             { 'default': '',      'type': str,  'arg': '--api-replay-dir'             },
+    REPLAY_LATENCY:             { 'default': '0',     'type': int,  'arg': '--replay-latency'             },
+    REPLAY_RATE_LIMIT_PERCENT:  { 'default': '0',     'type': int,  'arg': '--replay-rate-limit-percent'  },
+    REPLAY_ERROR_PERCENT:       { 'default': '0',     'type': int,  'arg': '--replay-error-percent'       },
+    REPLAY_SEED:                { 'default': '0',     'type': int,  'arg': '--replay-seed'                },
     TEMP_DOWNLOAD_DIR:          { 'default': '',      'type': str,  'arg': '--temp-download-dir'          },
     # New configuration options
     SINGLE_TRACK_FOLDER:        { 'default': 'Singles', 'type': str, 'arg': '--single-track-folder'       },
@@ -240,6 +318,100 @@ class Config:
     def get_download_real_time(cls) -> bool:
         return cls.get(DOWNLOAD_REAL_TIME)
 
+    @classmethod
+    def get_download_workers(cls) -> int:
+        return max(cls.get(DOWNLOAD_WORKERS), 1)
+
+    @classmethod
+    def get_download_pipeline(cls) -> bool:
+        return cls.get(DOWNLOAD_PIPELINE)
+
+    @classmethod
+    def get_prepare_workers(cls) -> int:
+        return max(cls.get(PREPARE_WORKERS), 1)
+
+    @classmethod
+    def get_postprocess_workers(cls) -> int:
+        return max(cls.get(POSTPROCESS_WORKERS), 1)
+
+    @classmethod
+    def get_pipeline_queue_size(cls) -> int:
+        return max(cls.get(PIPELINE_QUEUE_SIZE), 1)
+
+    @classmethod
+    def get_transcode_workers(cls) -> int:
+        if cls.get(TRANSCODE_WORKERS) > 0:
+            return cls.get(TRANSCODE_WORKERS)
+        return get_available_cores()
+
+    @classmethod
+    def get_stream_stall_timeout(cls) -> int:
+        return max(cls.get(STREAM_STALL_TIMEOUT), 0)
+
+    @classmethod
+    def get_min_stream_throughput(cls) -> int:
+        return max(cls.get(MIN_STREAM_THROUGHPUT), 0) * 1024
+
+    @classmethod
+    def get_stream_retries(cls) -> int:
+        return max(cls.get(STREAM_RETRIES), 0)
+
+    @classmethod
+    def get_stream_transcode(cls) -> bool:
+        return cls.get(STREAM_TRANSCODE)
+
+    @classmethod
+    def get_download_segments(cls) -> int:
+        return max(cls.get(DOWNLOAD_SEGMENTS), 1)
+
+    @classmethod
+    def get_bandwidth_limit(cls) -> str:
+        return cls.get(BANDWIDTH_LIMIT)
+
+    @classmethod
+    def get_bandwidth_burst(cls) -> int:
+        return max(cls.get(BANDWIDTH_BURST), 1)
+
+    @classmethod
+    def get_credentials_pool(cls) -> str:
+        return cls.get(CREDENTIALS_POOL)
+
+    @classmethod
+    def get_serve_port(cls) -> int:
+        return cls.get(SERVE_PORT)
+
+    @classmethod
+    def get_serve_token_location(cls) -> str:
+        if cls.get(SERVE_TOKEN_LOCATION) == '':
+            # next to the credentials, whoever may read those may use the daemon
+            serve_token_location = PurePath(Path(cls.get_credentials_location()).parent / 'serve_token')
+        else:
+            serve_token_location = PurePath(Path(cls.get(SERVE_TOKEN_LOCATION)).expanduser())
+        Path(serve_token_location.parent).mkdir(parents=True, exist_ok=True)
+        return serve_token_location
+
+    @classmethod
+    def get_job_queue(cls) -> bool:
+        return cls.get(JOB_QUEUE)
+
+    @classmethod
+    def get_job_queue_location(cls) -> str:
+        if cls.get(JOB_QUEUE_LOCATION) == '':
+            # next to the song archive, both record what was downloaded already
+            job_queue_location = PurePath(Path(cls.get_song_archive()).parent / 'jobs.db')
+        else:
+            job_queue_location = PurePath(Path(cls.get(JOB_QUEUE_LOCATION)).expanduser())
+        Path(job_queue_location.parent).mkdir(parents=True, exist_ok=True)
+        return job_queue_location
+
+    @classmethod
+    def get_scheduling_policy(cls) -> str:
+        return cls.get(SCHEDULING_POLICY)
+
+    @classmethod
+    def get_serve_jobs(cls) -> int:
+        return max(cls.get(SERVE_JOBS), 1)
+
     @classmethod
     def get_download_quality(cls) -> str:
         return cls.get(DOWNLOAD_QUALITY)
@@ -340,6 +512,93 @@ class Config:
     def get_retry_attempts(cls) -> int:
         return cls.get(RETRY_ATTEMPTS)
 
+    @classmethod
+    def get_http_pool_size(cls) -> int:
+        return cls.get(HTTP_POOL_SIZE)
+
+    @classmethod
+    def get_http_connect_timeout(cls) -> int:
+        return cls.get(HTTP_CONNECT_TIMEOUT)
+
+    @classmethod
+    def get_http_read_timeout(cls) -> int:
+        return cls.get(HTTP_READ_TIMEOUT)
+
+    @classmethod
+    def get_metadata_cache(cls) -> bool:
+        return cls.get(METADATA_CACHE)
+
+    @classmethod
+    def get_metadata_cache_location(cls) -> str:
+        if cls.get(METADATA_CACHE_LOCATION) == '':
+            system_paths = {
+                'win32': Path.home() / 'AppData/Local/Zotify',
+                'linux': Path.home() / '.cache/zotify',
+                'darwin': Path.home() / 'Library/Caches/Zotify'
+            }
+            if sys.platform not in system_paths:
+                cache_location = PurePath(Path.cwd() / '.zotify/metadata_cache.db')
+            else:
+                cache_location = PurePath(system_paths[sys.platform] / 'metadata_cache.db')
+        else:
+            cache_location = PurePath(Path(cls.get(METADATA_CACHE_LOCATION)).expanduser())
+        Path(cache_location.parent).mkdir(parents=True, exist_ok=True)
+        return cache_location
+
+    @classmethod
+    def get_metadata_cache_size(cls) -> int:
+        return cls.get(METADATA_CACHE_SIZE)
+
+    @classmethod
+    def get_api_rate_limit(cls) -> int:
+        return cls.get(API_RATE_LIMIT)
+
+    @classmethod
+    def get_pagination_window(cls) -> int:
+        return cls.get(PAGINATION_WINDOW)
+
+    @classmethod
+    def get_async_api(cls) -> bool:
+        return cls.get(ASYNC_API)
+
+    @classmethod
+    def get_async_api_concurrency(cls) -> int:
+        return cls.get(ASYNC_API_CONCURRENCY)
+
+    @classmethod
+    def get_incremental_playlist_sync(cls) -> bool:
+        return cls.get(INCREMENTAL_PLAYLIST_SYNC)
+
+    @classmethod
+    def get_api_record_dir(cls) -> str:
+        return cls.get(API_RECORD_DIR)
+
+    @classmethod
+    def get_api_replay_dir(cls) -> str:
+        return cls.get(API_REPLAY_DIR)
+
+    @classmethod
+    def get_replay_latency(cls) -> int:
+        return cls.get(REPLAY_LATENCY)
+
+    @classmethod
+    def get_replay_rate_limit_percent(cls) -> int:
+        return cls.get(REPLAY_RATE_LIMIT_PERCENT)
+
+    @classmethod
+    def get_replay_error_percent(cls) -> int:
+        return cls.get(REPLAY_ERROR_PERCENT)
+
+    @classmethod
+    def get_replay_seed(cls) -> int:
+        return cls.get(REPLAY_SEED)
+
+    @classmethod
+    def get_playlist_snapshot_dir(cls) -> str:
+        snapshot_dir = PurePath(cls.get_song_archive()).parent.joinpath('playlist_snapshots')
+        Path(snapshot_dir).mkdir(parents=True, exist_ok=True)
+        return snapshot_dir
+
     # New methods for the added configuration options
     @classmethod
     def get_single_track_folder(cls) -> str:
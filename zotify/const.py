@@ -8,6 +8,8 @@ TRACK_STATS_URL = 'https://api.spotify.com/v1/audio-features/'
 
 ALBUM_URL = 'https://api.spotify.com/v1/albums/'
 
+ARTISTS_URL = 'https://api.spotify.com/v1/artists'
+
 TRACKNUMBER = 'tracknumber'
 
 DISCNUMBER = 'discnumber'
@@ -117,3 +119,5 @@ EXT_MAP = {
 }
 
 TOTAL = 'total'
+
+API_BATCH_SIZE = 50
@@ -0,0 +1,253 @@
+import hmac
+import itertools
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from zotify.app import connect, download_from_urls, download_liked_songs, download_followed_artists
+from zotify.scheduler import Container, Scheduler
+from zotify.termoutput import Printer, PrintChannel
+from zotify.track import download_track
+from zotify.workers import DownloadPool
+from zotify.zotify import Zotify
+
+# jobs kept for status requests after they finished
+MAX_FINISHED_JOBS = 200
+# an event stream sends a heartbeat this often while a job is quiet, so clients can tell the daemon is alive
+HEARTBEAT_INTERVAL = 15
+
+
+class Job:
+    """ One request to the daemon, with everything it printed so far """
+
+    def __init__(self, job_id: int, request: dict):
+        self.id = job_id
+        self.request = request
+        # the downloads of every job take turns with those of the other running jobs
+        self.container = Container(f'job {job_id}', request.get('priority', 0))
+        self.status = 'queued'
+        self.error = None
+        self.counts = {'downloaded': 0, 'skipped': 0, 'failed': 0}
+        self.events: List[dict] = []
+        self.condition = threading.Condition()
+
+    def is_finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def add_event(self, event: dict) -> None:
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def on_print(self, kind: str, value: str) -> None:
+        if Scheduler.current() is not self.container:
+            # printed for another job
+            return
+        if kind == 'track':
+            self.counts[value] = self.counts.get(value, 0) + 1
+            self.add_event({'type': 'track', 'status': value})
+        else:
+            self.add_event({'type': 'message', 'text': value})
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        with self.condition:
+            self.status = status
+            self.error = error
+            self.events.append({'type': 'finished', **self.to_dict()})
+            self.condition.notify_all()
+
+    def wait_events(self, start: int, timeout: float) -> List[dict]:
+        """ Returns the events from index start on, waiting up to timeout for one if there are none yet """
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.events) > start or self.is_finished(), timeout)
+            return self.events[start:]
+
+    def to_dict(self) -> dict:
+        return {'id': self.id, 'request': self.request, 'status': self.status, 'error': self.error, **self.counts}
+
+
+class Daemon:
+    """ Keeps one logged in Zotify with its sessions, connection pools and caches, and runs the jobs posted to its
+        localhost HTTP API, SERVE_JOBS at a time and higher priorities first """
+    JOBS: Dict[int, Job] = {}
+    QUEUE: queue.PriorityQueue = queue.PriorityQueue()
+    _ids = itertools.count(1)
+    _lock = threading.Lock()
+
+    @classmethod
+    def add_job(cls, request: dict) -> Job:
+        if not any(request.get(key) for key in ('urls', 'liked', 'followed')):
+            raise ValueError('A job needs urls, liked or followed')
+        if 'urls' in request and not (isinstance(request['urls'], list)
+                                      and all(isinstance(url, str) for url in request['urls'])):
+            raise ValueError('urls must be a list of strings')
+        if not isinstance(request.get('priority', 0), int):
+            raise ValueError('priority must be an integer')
+        with cls._lock:
+            job = Job(next(cls._ids), request)
+            cls.JOBS[job.id] = job
+            finished = [job_id for job_id, other in cls.JOBS.items() if other.is_finished()]
+            for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+                del cls.JOBS[job_id]
+        cls.QUEUE.put((-job.container.priority, job.id, job))
+        return job
+
+    @classmethod
+    def get_job(cls, job_id: int) -> Optional[Job]:
+        with cls._lock:
+            return cls.JOBS.get(job_id)
+
+    @classmethod
+    def run_jobs(cls) -> None:
+        while True:
+            _, _, job = cls.QUEUE.get()
+            cls.run_job(job)
+
+    @classmethod
+    def run_job(cls, job: Job) -> None:
+        Printer.print(PrintChannel.PROGRESS_INFO, f'Starting job {job.id}: {json.dumps(job.request)}')
+        with cls._lock:
+            # the console counts the tracks of the jobs that run at the same time together
+            if not any(other.status == 'running' for other in cls.JOBS.values()):
+                Printer.download_progress = None
+            job.status = 'running'
+        Printer.add_listener(job.on_print)
+        with Scheduler.use(job.container):
+            try:
+                # the whole job is resolved before it starts downloading, so the scheduler knows its size
+                with DownloadPool.recording() as recorded:
+                    if job.request.get('urls'):
+                        download_from_urls(job.request['urls'])
+                    if job.request.get('liked'):
+                        download_liked_songs()
+                    if job.request.get('followed'):
+                        download_followed_artists()
+                job.container.size = len(recorded)
+                with DownloadPool() as pool:
+                    for fn, args, kwargs in recorded:
+                        if fn is download_track:
+                            pool.submit_track(*args, **kwargs)
+                        else:
+                            pool.submit(fn, *args, **kwargs)
+                # playlist snapshots are only stored once their tracks are through
+                recorded.run_deferred()
+            except Exception as e:
+                Printer.print(PrintChannel.ERRORS, ''.join(traceback.TracebackException.from_exception(e).format()))
+                job.finish('failed', str(e))
+            else:
+                job.finish('done')
+            finally:
+                Printer.remove_listener(job.on_print)
+        Printer.print(PrintChannel.PROGRESS_INFO, f'Finished job {job.id}: {job.status}')
+
+
+def write_token(location) -> str:
+    """ Creates the token clients have to send, in a file only the current user can read """
+    token = secrets.token_urlsafe(32)
+    fd = os.open(str(location), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as file:
+        # the mode of os.open only applies to new files
+        os.chmod(str(location), 0o600)
+        file.write(token)
+    return token
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'zotify'
+    # set by serve, every request has to carry it as a bearer token
+    TOKEN: str = None
+
+    def log_message(self, format, *args) -> None:
+        Printer.print(PrintChannel.DEBUG, f'daemon {self.address_string()} {format % args}')
+
+    def send_json(self, status: int, body) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def is_authorized(self) -> bool:
+        """ Answers 401 unless the request carries the token of the daemon """
+        sent = self.headers.get('Authorization', '')
+        if self.TOKEN and hmac.compare_digest(sent.encode('utf-8'), f'Bearer {self.TOKEN}'.encode('utf-8')):
+            return True
+        self.send_json(401, {'error': 'missing or wrong token, see SERVE_TOKEN_LOCATION'})
+        return False
+
+    def do_GET(self) -> None:
+        if not self.is_authorized():
+            return
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok', 'queued': Daemon.QUEUE.qsize()})
+            return
+        if self.path == '/jobs':
+            with Daemon._lock:
+                jobs = [job.to_dict() for job in Daemon.JOBS.values()]
+            self.send_json(200, jobs)
+            return
+        match = re.fullmatch(r'/jobs/(\d+)(/events)?', self.path)
+        job = Daemon.get_job(int(match.group(1))) if match else None
+        if job is None:
+            self.send_json(404, {'error': 'no such job'})
+        elif match.group(2):
+            self.stream_events(job)
+        else:
+            self.send_json(200, job.to_dict())
+
+    def stream_events(self, job: Job) -> None:
+        """ Sends the events of job as JSON lines as they happen, the response ends with the job """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        sent = 0
+        while True:
+            events = job.wait_events(sent, HEARTBEAT_INTERVAL)
+            lines = [json.dumps(event) for event in events] or [json.dumps({'type': 'heartbeat'})]
+            sent += len(events)
+            try:
+                self.wfile.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # the client went away, the job carries on
+                return
+            if events and events[-1]['type'] == 'finished':
+                return
+
+    def do_POST(self) -> None:
+        if not self.is_authorized():
+            return
+        if self.path != '/jobs':
+            self.send_json(404, {'error': 'not found'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            job = Daemon.add_job(request)
+        except (ValueError, AttributeError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(202, job.to_dict())
+
+
+def serve(args) -> None:
+    """ Logs in once and serves jobs on localhost until interrupted """
+    connect(args)
+    DaemonRequestHandler.TOKEN = write_token(Zotify.CONFIG.get_serve_token_location())
+    server = ThreadingHTTPServer(('127.0.0.1', Zotify.CONFIG.get_serve_port()), DaemonRequestHandler)
+    server.daemon_threads = True
+    for n in range(Zotify.CONFIG.get_serve_jobs()):
+        threading.Thread(target=Daemon.run_jobs, name=f'zotify-jobs-{n}', daemon=True).start()
+    Printer.print(PrintChannel.PROGRESS_INFO, f'Listening for jobs on http://127.0.0.1:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,123 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from zotify.config import Config
+from zotify.ratelimit import RateLimiter, BandwidthLimiter, CONTENT_HOST, parse_retry_after, parse_bandwidth_schedule
+from zotify.replay import Recorder, ReplayTransport, ReplayResponse
+
+
+class HttpClient:
+    """ Shared keep-alive HTTP client, one connection pool per host for the whole process """
+    SESSION: requests.Session = None
+    RATE_LIMITER: RateLimiter = None
+    BANDWIDTH_LIMITER: BandwidthLimiter = None
+    # set up by Zotify from API_RECORD_DIR / API_REPLAY_DIR, they only see replayable requests
+    RECORDER: Recorder = None
+    REPLAY: ReplayTransport = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        if cls.SESSION is None:
+            with cls._lock:
+                if cls.SESSION is None:
+                    pool_size = Config.get_http_pool_size()
+                    # pool_block makes surplus threads wait for a pooled connection
+                    # instead of opening (and then discarding) extra ones
+                    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+                    session = requests.Session()
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    cls.SESSION = session
+        return cls.SESSION
+
+    @classmethod
+    def get_rate_limiter(cls) -> RateLimiter:
+        if cls.RATE_LIMITER is None:
+            with cls._lock:
+                if cls.RATE_LIMITER is None:
+                    rate = Config.get_api_rate_limit()
+                    limiter = RateLimiter(rate, rate)
+                    # BULK_WAIT_TIME is the minimum spacing between two content streams
+                    if Config.get_bulk_wait_time() and not Config.get_override_auto_wait():
+                        limiter.set_budget(CONTENT_HOST, 1 / Config.get_bulk_wait_time(), 1)
+                    else:
+                        limiter.set_budget(CONTENT_HOST, None, 1)
+                    cls.RATE_LIMITER = limiter
+        return cls.RATE_LIMITER
+
+    @classmethod
+    def get_bandwidth_limiter(cls) -> BandwidthLimiter:
+        if cls.BANDWIDTH_LIMITER is None:
+            with cls._lock:
+                if cls.BANDWIDTH_LIMITER is None:
+                    cls.BANDWIDTH_LIMITER = BandwidthLimiter(parse_bandwidth_schedule(Config.get_bandwidth_limit()),
+                                                             Config.get_bandwidth_burst())
+        return cls.BANDWIDTH_LIMITER
+
+    @classmethod
+    def get_timeout(cls) -> tuple:
+        return Config.get_http_connect_timeout(), Config.get_http_read_timeout()
+
+    @classmethod
+    def get(cls, url, **kwargs) -> requests.Response:
+        return cls.request('GET', url, **kwargs)
+
+    @classmethod
+    def head(cls, url, **kwargs) -> requests.Response:
+        return cls.request('HEAD', url, **kwargs)
+
+    @classmethod
+    def request(cls, method, url, replayable=False, **kwargs) -> requests.Response:
+        """ Sends a request through the shared pool, replayable marks Web API calls for record/replay """
+        kwargs.setdefault('timeout', cls.get_timeout())
+        limiter = cls.get_rate_limiter()
+        host = urlsplit(url).hostname
+        limiter.acquire(host)
+        time_start = time.monotonic()
+        if replayable and cls.REPLAY:
+            response = cls.REPLAY.request(method, url, **kwargs)
+        else:
+            response = cls.get_session().request(method, url, **kwargs)
+            if replayable and cls.RECORDER:
+                cls.RECORDER.record(url, kwargs.get('params'), response)
+        cls._log_request(method, response, time.monotonic() - time_start)
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if limiter.on_response(host, response.status_code, retry_after):
+            # we need to import that here, otherwise we will get circular imports!
+            from zotify.termoutput import Printer, PrintChannel
+            Printer.print(PrintChannel.WARNINGS, f'{host} answered {response.status_code}, slowing down requests'
+                          + (f' and pausing for {retry_after:.0f}s' if retry_after else ''))
+        return response
+
+    @classmethod
+    def _log_request(cls, method, response, elapsed) -> None:
+        # we need to import that here, otherwise we will get circular imports!
+        from zotify.termoutput import Printer, PrintChannel
+        if not Printer.is_enabled(PrintChannel.DEBUG):
+            return
+        parts = urlsplit(response.url)
+        if isinstance(response, ReplayResponse):
+            Printer.print(PrintChannel.DEBUG, f'REPLAY {method} {parts.netloc}{parts.path} -> '
+                                              f'{response.status_code} in {elapsed * 1000:.0f} ms')
+            return
+        connections, requests_sent = cls.get_pool_stats(response.url)
+        Printer.print(PrintChannel.DEBUG,
+                      f'HTTP {method} {parts.netloc}{parts.path} -> {response.status_code} in {elapsed * 1000:.0f} ms '
+                      f'({connections} connections / {requests_sent} requests to {parts.hostname})')
+
+    @classmethod
+    def get_pool_stats(cls, url) -> tuple:
+        """ Returns how many connections were opened and requests were sent to the host of url """
+        host = urlsplit(url).hostname
+        pools = cls.get_session().get_adapter(url).poolmanager.pools
+        connections = requests_sent = 0
+        for key in pools.keys():
+            if key.key_host == host:
+                connections += pools[key].num_connections
+                requests_sent += pools[key].num_requests
+        return connections, requests_sent
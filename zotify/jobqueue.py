@@ -0,0 +1,143 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+# tracks that failed this many runs are left alone
+MAX_ATTEMPTS = 3
+TRACK_STATES = ('pending', 'streaming', 'converting', 'done', 'failed')
+
+
+class JobQueue:
+    """ SQLite record of -d batches: the urls of every url file, the tracks and episodes they expanded into
+        and how far each of those got, so an interrupted batch continues with only what is left """
+
+    def __init__(self, location):
+        Path(location).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(location), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS batches ('
+                        'id INTEGER PRIMARY KEY, source TEXT NOT NULL UNIQUE, started REAL NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS items ('
+                        'id INTEGER PRIMARY KEY, batch INTEGER NOT NULL, position INTEGER NOT NULL, url TEXT NOT NULL, '
+                        'expanded INTEGER NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, '
+                        'UNIQUE (batch, url))')
+        self.db.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                        'id INTEGER PRIMARY KEY, batch INTEGER NOT NULL, kind TEXT NOT NULL, arguments TEXT NOT NULL, '
+                        "state TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, error TEXT, "
+                        'updated REAL, item INTEGER)')
+        # queues of older versions do not know which url a job came from
+        if 'item' not in [column[1] for column in self.db.execute('PRAGMA table_info(jobs)')]:
+            self.db.execute('ALTER TABLE jobs ADD COLUMN item INTEGER')
+        # nor how often a url failed to expand
+        if 'attempts' not in [column[1] for column in self.db.execute('PRAGMA table_info(items)')]:
+            self.db.execute('ALTER TABLE items ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+            self.db.execute('ALTER TABLE items ADD COLUMN error TEXT')
+        self.db.execute('CREATE INDEX IF NOT EXISTS jobs_batch_state ON jobs (batch, state)')
+        self.db.commit()
+
+    def open_batch(self, source: str, urls: List[str]) -> int:
+        """ Returns the batch of source, starting it over if its last run left nothing to do.
+            Urls that were added to the file since are appended """
+        with self.lock:
+            self.db.execute('INSERT OR IGNORE INTO batches (source, started) VALUES (?, ?)', (source, time.time()))
+            batch = self.db.execute('SELECT id FROM batches WHERE source = ?', (source,)).fetchone()[0]
+            if self._is_finished(batch):
+                self.db.execute('DELETE FROM items WHERE batch = ?', (batch,))
+                self.db.execute('DELETE FROM jobs WHERE batch = ?', (batch,))
+                self.db.execute('UPDATE batches SET started = ? WHERE id = ?', (time.time(), batch))
+            position = self.db.execute('SELECT COALESCE(MAX(position), 0) FROM items WHERE batch = ?', (batch,)).fetchone()[0]
+            self.db.executemany('INSERT OR IGNORE INTO items (batch, position, url) VALUES (?, ?, ?)',
+                                [(batch, position + n, url) for n, url in enumerate(urls, 1)])
+            self.db.commit()
+        return batch
+
+    def _is_finished(self, batch: int) -> bool:
+        items = self.db.execute('SELECT COUNT(*) FROM items WHERE batch = ?', (batch,)).fetchone()[0]
+        unexpanded = self.db.execute('SELECT COUNT(*) FROM items WHERE batch = ? AND NOT expanded AND attempts < ?',
+                                     (batch, MAX_ATTEMPTS)).fetchone()[0]
+        left = self.db.execute("SELECT COUNT(*) FROM jobs WHERE batch = ? AND state != 'done' AND attempts < ?",
+                               (batch, MAX_ATTEMPTS)).fetchone()[0]
+        return items > 0 and unexpanded == 0 and left == 0
+
+    def get_unexpanded(self, batch: int, limit: int, exclude: Set[int]) -> List[Tuple[int, str]]:
+        """ Returns up to limit (item id, url) that were not expanded yet, in file order, except those in exclude """
+        with self.lock:
+            rows = self.db.execute('SELECT id, url FROM items WHERE batch = ? AND NOT expanded AND attempts < ? '
+                                   'ORDER BY position', (batch, MAX_ATTEMPTS)).fetchall()
+        return [(item_id, url) for item_id, url in rows if item_id not in exclude][:limit]
+
+    def expand(self, batch: int, item_ids: List[int], jobs: Iterable[Tuple[int, str, dict]]) -> None:
+        """ Stores the (item id, kind, arguments) jobs that item_ids expanded into, all of it or nothing """
+        with self.lock, self.db:
+            self.db.executemany('INSERT INTO jobs (batch, item, kind, arguments) VALUES (?, ?, ?, ?)',
+                                [(batch, item_id, kind, json.dumps(arguments)) for item_id, kind, arguments in jobs])
+            self.db.executemany('UPDATE items SET expanded = 1 WHERE id = ?', [(item_id,) for item_id in item_ids])
+
+    def fail_item(self, item_id: int, error: str) -> None:
+        """ Records that a url could not be expanded, it is tried again by the next run up to MAX_ATTEMPTS times """
+        with self.lock:
+            self.db.execute('UPDATE items SET attempts = attempts + 1, error = ? WHERE id = ?', (error, item_id))
+            self.db.commit()
+
+    def get_jobs(self, batch: int, exclude: Set[int]) -> List[Tuple[int, Optional[int], str, dict]]:
+        """ Returns (job id, item id, kind, arguments) of every job that still has to run, except those in exclude """
+        with self.lock:
+            rows = self.db.execute("SELECT id, item, kind, arguments FROM jobs WHERE batch = ? AND state != 'done' "
+                                   'AND attempts < ? ORDER BY id', (batch, MAX_ATTEMPTS)).fetchall()
+        return [(job_id, item_id, kind, json.loads(arguments)) for job_id, item_id, kind, arguments in rows
+                if job_id not in exclude]
+
+    def is_item_done(self, item_id: int) -> bool:
+        """ Returns whether every job a url expanded into is done """
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM jobs WHERE item = ? AND state != 'done'",
+                                   (item_id,)).fetchone()[0] == 0
+
+    def set_state(self, job_id: int, state: str, error: Optional[str] = None) -> None:
+        with self.lock:
+            self.db.execute('UPDATE jobs SET state = ?, error = ?, updated = ?, attempts = attempts + ? WHERE id = ?',
+                            (state, error, time.time(), int(state == 'failed'), job_id))
+            self.db.commit()
+
+    def get_status(self) -> List[dict]:
+        """ Returns the progress of every batch """
+        status = []
+        with self.lock:
+            for batch, source, started in self.db.execute('SELECT id, source, started FROM batches ORDER BY started').fetchall():
+                items, expanded, unresolved = self.db.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(expanded), 0), COALESCE(SUM(NOT expanded AND attempts > 0), 0) '
+                    'FROM items WHERE batch = ?', (batch,)).fetchone()
+                states = dict(self.db.execute('SELECT state, COUNT(*) FROM jobs WHERE batch = ? GROUP BY state',
+                                              (batch,)).fetchall())
+                status.append({'source': source, 'started': started, 'urls': items, 'expanded': expanded,
+                               'unresolved': unresolved,
+                               **{state: states.get(state, 0) for state in TRACK_STATES},
+                               'finished': self._is_finished(batch)})
+        return status
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+
+def print_status(location) -> None:
+    """ Prints the progress of every -d batch recorded at location """
+    if not Path(location).exists():
+        print('No -d batches were recorded yet.')
+        return
+    queue = JobQueue(location)
+    try:
+        for batch in queue.get_status():
+            started = time.strftime('%Y-%m-%d %H:%M', time.localtime(batch['started']))
+            print(f"{batch['source']} ({'finished' if batch['finished'] else 'unfinished'}, started {started})")
+            print(f"  urls:   {batch['expanded']} of {batch['urls']} expanded, {batch['unresolved']} failed to expand")
+            print(f"  tracks: {batch['done']} done, {batch['failed']} failed, {batch['pending']} pending, "
+                  f"{batch['streaming']} streaming, {batch['converting']} converting")
+    finally:
+        queue.close()
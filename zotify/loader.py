@@ -19,11 +19,14 @@ class Loader:
         self.stop()
 
     def start(self):
-        self.thread.start()
+        # download workers share the terminal, so they do not animate
+        if not Printer.is_background_thread():
+            self.thread.start()
 
     def stop(self):
         self.done = True
-        self.thread.join()
+        if self.thread.ident is not None:
+            self.thread.join()
 
     def _animate(self):
         for c in itertools.cycle(self.steps):
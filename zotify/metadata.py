@@ -1,13 +1,16 @@
+import base64
 import os
 import re
+import threading
 from pathlib import Path
-import requests
-from mutagen import File
+from mutagen import File, MutagenError
+from mutagen.flac import Picture
 from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB, TDRC, TRCK, TPOS
 from mutagen.mp3 import MP3
 from mutagen.oggvorbis import OggVorbis
 
 from zotify.config import Config
+from zotify.httpclient import HttpClient
 
 SANITIZE = ["\\", "/", ":", "*", "?", "'", "<", ">", "\""]
 
@@ -44,7 +47,18 @@ def get_file_path(artist, album, track_title, track_number=None, playlist_name=N
 
     return os.path.join(directory, f"{filename}.{Config.get_download_format()}")
 
-def set_audio_tags(filename, artists, title, album_name, release_year, disc_number, track_number, album_artist=None):
+def is_ogg_vorbis(filename):
+    """ Returns whether filename is a complete Ogg Vorbis stream that can be kept as it is """
+    try:
+        with open(filename, 'rb') as file:
+            if file.read(4) != b'OggS':
+                return False
+        # parses the headers and the last page, which fails for a truncated stream
+        return OggVorbis(filename).info.length > 0
+    except (OSError, MutagenError):
+        return False
+
+def set_audio_tags(filename, artists, title, album_name, release_year, disc_number, track_number, album_artist=None, cover=None):
     audio = File(filename, easy=True)
     
     if Config.get_only_main_artist_in_artist_tag():
@@ -60,17 +74,36 @@ def set_audio_tags(filename, artists, title, album_name, release_year, disc_numb
     
     if album_artist:
         audio['albumartist'] = album_artist
+
+    if cover and isinstance(audio, OggVorbis):
+        # embedded the Vorbis way, a base64 FLAC picture block, saved together with the other comments
+        picture = Picture()
+        picture.type = 3
+        picture.mime = 'image/jpeg'
+        picture.data = cover
+        audio['metadata_block_picture'] = [base64.b64encode(picture.write()).decode('ascii')]
     
     audio.save()
 
-def set_music_thumbnail(directory, image_url):
-    """ Downloads cover artwork """
+def get_cover_art(image_url):
+    """ Downloads cover artwork, returns its bytes or None if it could not be downloaded """
+    try:
+        return HttpClient.get(image_url).content
+    except Exception as e:
+        print(f"Error while downloading thumbnail: {str(e)}")
+
+def set_music_thumbnail(directory, image_url, img_data=None):
+    """ Saves cover artwork as folder.jpg unless the directory has one, img_data saves downloading it again """
     try:
         img_path = os.path.join(directory, "folder.jpg")
         if not os.path.exists(img_path):
-            img_data = requests.get(image_url).content
-            with open(img_path, "wb") as img_file:
+            if img_data is None:
+                img_data = HttpClient.get(image_url).content
+            # tracks of the same album may download their cover at the same time
+            temp_path = f"{img_path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as img_file:
                 img_file.write(img_data)
+            os.replace(temp_path, img_path)
     except Exception as e:
         print(f"Error while downloading thumbnail: {str(e)}")
 
@@ -0,0 +1,71 @@
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List, Tuple
+
+from zotify.scheduler import Scheduler
+from zotify.termoutput import Printer, PrintChannel
+
+
+def run_stage(job, stage: str) -> bool:
+    """ Runs one stage of job, returns whether the job goes on to the next stage """
+    try:
+        return bool(getattr(job, stage)())
+    except Exception as e:
+        job.fail(e)
+        return False
+
+
+def run_stages(job, stages: List[str]) -> None:
+    """ Runs every stage of job on the calling thread, like the pipeline would but without overlap """
+    try:
+        for stage in stages:
+            if not run_stage(job, stage):
+                break
+    finally:
+        job.finish()
+
+
+class Pipeline:
+    """ Moves jobs through stages that each run on their own threads, joined by bounded queues.
+        A job provides one method per stage returning whether it continues, fail(e) and finish() """
+
+    def __init__(self, stages: List[Tuple[str, int]], queue_size: int):
+        # stages are (method name, number of threads) in the order a job passes them
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=max(queue_size, 1)) for _ in stages]
+        for index, (name, workers) in enumerate(stages):
+            for n in range(max(workers, 1)):
+                threading.Thread(target=self._work, args=(index,), name=f'zotify-{name}-{n}', daemon=True).start()
+
+    def submit(self, job) -> Future:
+        """ Queues job for the first stage, blocks while that stage is backed up """
+        future = Future()
+        self.queues[0].put((job, future))
+        return future
+
+    def _work(self, index: int) -> None:
+        Printer.set_background_thread()
+        name, _ = self.stages[index]
+        stage_queue = self.queues[index]
+        # stage threads live as long as the process, every batch waits for the futures of its own jobs
+        while True:
+            job, future = stage_queue.get()
+            # jobs of an interrupted batch are cancelled before they start
+            if index == 0 and not future.set_running_or_notify_cancel():
+                continue
+            try:
+                # prints of the job are attributed to the container it was submitted for
+                with Scheduler.use(getattr(job, 'container', None)):
+                    goes_on = run_stage(job, name)
+                if goes_on and index + 1 < len(self.queues):
+                    next_queue = self.queues[index + 1]
+                    if next_queue.full():
+                        Printer.print(PrintChannel.DEBUG, f'{self.stages[index + 1][0]} is backed up, {name} waits')
+                    # blocks while the next stage is backed up, which in turn holds back this one
+                    next_queue.put((job, future))
+                    continue
+                job.finish()
+                future.set_result(None)
+            except Exception as e:
+                future.set_exception(e)
@@ -1,7 +1,8 @@
-from zotify.const import ITEMS, ID, TRACK, NAME
-from zotify.termoutput import Printer
-from zotify.track import download_track
-from zotify.utils import split_input
+from zotify.const import ID, TRACK, NAME
+from zotify.termoutput import Printer, PrintChannel
+from zotify.track import prefetch_song_info, watch_track_failures
+from zotify.utils import split_input, get_playlist_snapshot, save_playlist_snapshot
+from zotify.workers import DownloadPool
 from zotify.zotify import Zotify
 
 MY_PLAYLISTS_URL = 'https://api.spotify.com/v1/me/playlists'
@@ -10,34 +11,12 @@ PLAYLISTS_URL = 'https://api.spotify.com/v1/playlists'
 
 def get_all_playlists():
     """ Returns list of users playlists """
-    playlists = []
-    limit = 50
-    offset = 0
+    return Zotify.invoke_url_paginated(MY_PLAYLISTS_URL, limit=50)
 
-    while True:
-        resp = Zotify.invoke_url_with_params(MY_PLAYLISTS_URL, limit=limit, offset=offset)
-        offset += limit
-        playlists.extend(resp[ITEMS])
-        if len(resp[ITEMS]) < limit:
-            break
 
-    return playlists
-
-
-def get_playlist_songs(playlist_id):
+def get_playlist_songs(playlist_id, use_cache=True):
     """ returns list of songs in a playlist """
-    songs = []
-    offset = 0
-    limit = 100
-
-    while True:
-        resp = Zotify.invoke_url_with_params(f'{PLAYLISTS_URL}/{playlist_id}/tracks', limit=limit, offset=offset)
-        offset += limit
-        songs.extend(resp[ITEMS])
-        if len(resp[ITEMS]) < limit:
-            break
-
-    return songs
+    return Zotify.invoke_url_paginated(f'{PLAYLISTS_URL}/{playlist_id}/tracks', limit=100, use_cache=use_cache)
 
 
 def get_playlist_info(playlist_id):
@@ -46,16 +25,89 @@ def get_playlist_info(playlist_id):
     return resp['name'].strip(), resp['owner']['display_name'].strip()
 
 
+def get_playlist_snapshot_id(playlist_id):
+    """ Returns the current snapshot id of a playlist, which changes whenever its items do """
+    (raw, resp) = Zotify.invoke_url(f'{PLAYLISTS_URL}/{playlist_id}?fields=snapshot_id', use_cache=False)
+    return resp.get('snapshot_id')
+
+
+class PlaylistSync:
+    """ Compares a playlist with the snapshot stored by its last sync, a no-op unless INCREMENTAL_PLAYLIST_SYNC is on """
+
+    def __init__(self, playlist_id):
+        self.playlist_id = playlist_id
+        self.snapshot_id = None
+        self.synced_snapshot_id = None
+        self.synced_ids = set()
+        # the tracks of the playlist, and how many of them failed since they were listed
+        self.track_ids = set()
+        self.failed = 0
+        if Zotify.CONFIG.get_incremental_playlist_sync():
+            self.snapshot_id = get_playlist_snapshot_id(playlist_id)
+            self.synced_snapshot_id, synced_ids = get_playlist_snapshot(playlist_id)
+            self.synced_ids = set(synced_ids)
+            # only failures of its own tracks hold the snapshot back, whatever else runs at the same time
+            watch_track_failures(self)
+
+    def on_track_failed(self, track_ids) -> None:
+        if self.track_ids & track_ids:
+            self.failed += 1
+
+    def is_unchanged(self, name) -> bool:
+        if self.snapshot_id is None or self.snapshot_id != self.synced_snapshot_id:
+            return False
+        Printer.print(PrintChannel.SKIPS, f'\n###   SKIPPING: {name} (PLAYLIST UNCHANGED SINCE LAST SYNC)   ###')
+        return True
+
+    def is_fresh_listing_needed(self) -> bool:
+        # the items are diffed against the fresh snapshot id, which a cached listing may predate
+        return self.snapshot_id is not None
+
+    def is_new(self, track_id) -> bool:
+        return track_id not in self.synced_ids
+
+    def report(self, name, track_ids) -> None:
+        self.track_ids = set(track_ids)
+        if self.synced_snapshot_id is None:
+            return
+        added = len([track_id for track_id in track_ids if self.is_new(track_id)])
+        Printer.print(PrintChannel.SKIPS, f'\n###   {name}: {added} NEW TRACKS SINCE LAST SYNC   ###')
+
+    def commit(self, track_ids) -> None:
+        """ Stores the synced snapshot, unless a track failed and has to be retried next time """
+        # recorded tracks have not run yet, the snapshot waits for them
+        if DownloadPool.defer(lambda: self.commit(track_ids)):
+            return
+        if self.snapshot_id is None or self.failed:
+            return
+        save_playlist_snapshot(self.playlist_id, self.snapshot_id, track_ids)
+
+
 def download_playlist(playlist):
     """Downloads all the songs from a playlist"""
 
-    playlist_songs = [song for song in get_playlist_songs(playlist[ID]) if song[TRACK] is not None and song[TRACK][ID]]
-    p_bar = Printer.progress(playlist_songs, unit='song', total=len(playlist_songs), unit_scale=True)
-    enum = 1
-    for song in p_bar:
-        download_track('extplaylist', song[TRACK][ID], extra_keys={'playlist': playlist[NAME], 'playlist_num': str(enum).zfill(2)}, disable_progressbar=True)
-        p_bar.set_description(song[TRACK][NAME])
-        enum += 1
+    sync = PlaylistSync(playlist[ID])
+    if sync.is_unchanged(playlist[NAME]):
+        return
+
+    playlist_songs = [song for song in get_playlist_songs(playlist[ID], use_cache=not sync.is_fresh_listing_needed()) if song[TRACK] is not None and song[TRACK][ID]]
+    track_ids = [song[TRACK][ID] for song in playlist_songs]
+    sync.report(playlist[NAME], track_ids)
+    # only new songs are downloaded, but they keep their position so playlist numbers stay stable
+    numbered_songs = [(enum, song) for enum, song in enumerate(playlist_songs, 1) if sync.is_new(song[TRACK][ID])]
+    song_infos = prefetch_song_info([song[TRACK][ID] for _, song in numbered_songs])
+    p_bar = Printer.progress(unit='song', total=len(numbered_songs), unit_scale=True)
+
+    def song_done(song_name):
+        p_bar.set_description(song_name)
+        p_bar.update()
+
+    with p_bar, DownloadPool() as pool:
+        for enum, song in numbered_songs:
+            pool.submit_track('extplaylist', song[TRACK][ID], extra_keys={'playlist': playlist[NAME], 'playlist_num': str(enum).zfill(2)}, disable_progressbar=True,
+                              song_info=song_infos.get(song[TRACK][ID])).add_done_callback(lambda _, song_name=song[TRACK][NAME]: song_done(song_name))
+
+    sync.commit(track_ids)
 
 
 def download_from_user_playlist():
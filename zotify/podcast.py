@@ -1,15 +1,18 @@
 # import os
 from pathlib import PurePath, Path
-import time
 from typing import Optional, Tuple
 
 from librespot.metadata import EpisodeId
 
-from zotify.const import ERROR, ID, ITEMS, NAME, SHOW, DURATION_MS
+from zotify.const import ERROR, ID, NAME, SHOW, DURATION_MS
 from zotify.termoutput import PrintChannel, Printer
+from zotify.httpclient import HttpClient
 from zotify.utils import create_download_directory, fix_filename
 from zotify.zotify import Zotify
 from zotify.loader import Loader
+from zotify.resume import PartialDownload
+from zotify.segments import SegmentedDownload, probe_ranges, get_segment_count
+from zotify.streaming import StreamPump, close_content_stream
 
 
 EPISODE_INFO_URL = 'https://api.spotify.com/v1/episodes'
@@ -28,46 +31,97 @@ def get_episode_info(episode_id_str) -> Tuple[Optional[str], Optional[str]]:
 
 
 def get_show_episodes(show_id_str) -> list:
-    episodes = []
-    offset = 0
-    limit = 50
-
     with Loader(PrintChannel.PROGRESS_INFO, "Fetching episodes..."):
-        while True:
-            resp = Zotify.invoke_url_with_params(
-                f'{SHOWS_URL}/{show_id_str}/episodes', limit=limit, offset=offset)
-            offset += limit
-            for episode in resp[ITEMS]:
-                episodes.append(episode[ID])
-            if len(resp[ITEMS]) < limit:
-                break
-
-    return episodes
-
-
-def download_podcast_directly(url, filename):
-    import functools
-    import shutil
-    import requests
-    from tqdm.auto import tqdm
-
-    r = requests.get(url, stream=True, allow_redirects=True)
-    if r.status_code != 200:
+        episodes = Zotify.invoke_url_paginated(f'{SHOWS_URL}/{show_id_str}/episodes', limit=50)
+
+    return [episode[ID] for episode in episodes]
+
+
+def download_podcast_segmented(url, path, size, content_id):
+    """ Downloads an episode over DOWNLOAD_SEGMENTS connections that each fetch a range of it """
+    download = SegmentedDownload(url, path, size, content_id)
+    done = download.load(get_segment_count(size))
+    with HttpClient.get_bandwidth_limiter().open() as share, Printer.progress(
+        desc="",
+        total=size,
+        unit='B',
+        unit_scale=True,
+        unit_divisor=1024
+    ) as p_bar:
+        p_bar.update(done)
+        download.run(on_progress=Printer.bandwidth_progress(p_bar), throttle=share.throttle)
+
+    download.commit(path)
+    return path
+
+
+def download_podcast_directly(url, filename, episode_id=None):
+    """ Downloads an episode hosted outside of Spotify, continuing an interrupted download with a range request """
+    path = Path(filename).expanduser().resolve()
+    partial = PartialDownload(path, episode_id or url)
+    offset = partial.load()
+
+    # a download already running over one connection is continued that way
+    probe = probe_ranges(url) if Zotify.CONFIG.get_download_segments() > 1 and not offset else None
+    if probe and get_segment_count(probe[1]) > 1:
+        return download_podcast_segmented(probe[0], path, probe[1], episode_id or url)
+    if offset and not partial.expected_size:
+        # the first attempt did not know the size, there is nothing to check a range against
+        offset = 0
+    # the body is streamed to disk as it is, so it is asked for without a content encoding
+    headers = {'Accept-Encoding': 'identity'}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+
+    r = HttpClient.get(url, stream=True, allow_redirects=True, headers=headers)
+    if offset and r.status_code == 416 and offset == partial.expected_size:
+        # nothing is left after the partial file, it only missed being moved into place
+        r.close()
+        partial.commit(path)
+        return path
+    if offset and r.status_code != 200 and not (
+            r.status_code == 206 and r.headers.get('Content-Range', '').endswith(f'/{partial.expected_size}')):
+        # the partial file can not be continued, so it is downloaded again from the start
+        r.close()
+        offset = 0
+        del headers['Range']
+        r = HttpClient.get(url, stream=True, allow_redirects=True, headers=headers)
+    if r.status_code == 206 and offset and r.headers.get('Content-Range', '').endswith(f'/{partial.expected_size}'):
+        file_size = partial.expected_size
+    elif r.status_code == 200:
+        # no partial file, or the server ignores ranges or serves another file now, so start from scratch
+        offset = 0
+        file_size = int(r.headers.get('Content-Length', 0))
+        if r.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+            # encoded anyway, Content-Length counts the encoded bytes
+            file_size = 0
+    else:
         r.raise_for_status()  # Will only raise for 4xx codes, so...
         raise RuntimeError(
             f"Request to {url} returned status code {r.status_code}")
-    file_size = int(r.headers.get('Content-Length', 0))
-
-    path = Path(filename).expanduser().resolve()
-    path.parent.mkdir(parents=True, exist_ok=True)
-
-    desc = "(Unknown total file size)" if file_size == 0 else ""
-    r.raw.read = functools.partial(
-        r.raw.read, decode_content=True)  # Decompress if needed
-    with tqdm.wrapattr(r.raw, "read", total=file_size, desc=desc) as r_raw:
-        with path.open("wb") as f:
-            shutil.copyfileobj(r_raw, f)
 
+    with partial.open(file_size, offset), HttpClient.get_bandwidth_limiter().open() as share, Printer.progress(
+        desc="(Unknown total file size)" if file_size == 0 else "",
+        total=file_size or None,
+        unit='B',
+        unit_scale=True,
+        unit_divisor=1024
+    ) as p_bar:
+        p_bar.update(offset)
+        pump = StreamPump(partial.write, Zotify.CONFIG.get_chunk_size(), on_progress=Printer.bandwidth_progress(p_bar),
+                          throttle=share.throttle, stall_timeout=Zotify.CONFIG.get_stream_stall_timeout(),
+                          min_throughput=Zotify.CONFIG.get_min_stream_throughput())
+        try:
+            if file_size:
+                pump.copy(readinto=r.raw.readinto, limit=file_size - offset)
+            else:
+                # readinto hands out the raw bytes, read decodes a content encoding the server applied anyway
+                pump.copy(read=lambda size: r.raw.read(size, decode_content=True))
+        finally:
+            if pump.aborted:
+                r.close()
+
+    partial.commit(path)
     return path
 
 
@@ -108,31 +162,39 @@ def download_episode(episode_id) -> None:
                 prepare_download_loader.stop()
                 return
 
+            # the stream starts behind the Spotify header, which is not part of the file
+            start = stream.input_stream.stream().pos()
+            partial = PartialDownload(filepath, episode_id.to_spotify_uri(), stream.metrics.file_id)
+            offset = partial.load(total_size - start)
+            if offset:
+                stream.input_stream.stream().seek(start + offset)
+
             prepare_download_loader.stop()
-            time_start = time.time()
-            downloaded = 0
-            with open(filepath, 'wb') as file, Printer.progress(
+
+            # DOWNLOAD_REAL_TIME caps the stream at the rate it would be played at
+            real_time_rate = total_size / (duration_ms / 1000) if Zotify.CONFIG.get_download_real_time() else None
+            share = HttpClient.get_bandwidth_limiter().open(real_time_rate)
+            with partial.open(total_size - start, offset), share, Printer.progress(
                 desc=filename,
                 total=total_size,
                 unit='B',
                 unit_scale=True,
                 unit_divisor=1024
             ) as p_bar:
-                prepare_download_loader.stop()
-                while True:
-                #for _ in range(int(total_size / Zotify.CONFIG.get_chunk_size()) + 2):
-                    data = stream.input_stream.stream().read(Zotify.CONFIG.get_chunk_size())
-                    p_bar.update(file.write(data))
-                    downloaded += len(data)
-                    if data == b'':
-                        break
-                    if Zotify.CONFIG.get_download_real_time():
-                        delta_real = time.time() - time_start
-                        delta_want = (downloaded / total_size) * (duration_ms/1000)
-                        if delta_want > delta_real:
-                            time.sleep(delta_want - delta_real)
+                p_bar.update(start + offset)
+                pump = StreamPump(partial.write, Zotify.CONFIG.get_chunk_size(), on_progress=Printer.bandwidth_progress(p_bar),
+                                  throttle=share.throttle,
+                                  stall_timeout=Zotify.CONFIG.get_stream_stall_timeout(),
+                                  min_throughput=Zotify.CONFIG.get_min_stream_throughput())
+                try:
+                    pump.copy(read=stream.input_stream.stream().read, limit=total_size - start - offset,
+                              position=start + offset)
+                finally:
+                    if pump.aborted:
+                        close_content_stream(stream.input_stream.stream())
+            partial.commit(filepath)
         else:
             filepath = PurePath(download_directory).joinpath(f"{filename}.mp3")
-            download_podcast_directly(direct_download_url, filepath)
+            download_podcast_directly(direct_download_url, filepath, episode_id)
 
     prepare_download_loader.stop()
@@ -0,0 +1,237 @@
+import email.utils
+import threading
+import time
+from typing import List, Optional, Tuple
+
+# budget key used for librespot content streams, which do not go through HttpClient
+CONTENT_HOST = 'content'
+
+# AIMD: grow the rate by this many requests per second after every success ...
+RATE_INCREASE = 0.5
+# ... and multiply it by this factor after every 429 or 5xx
+RATE_DECREASE = 0.5
+MIN_RATE = 0.2
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """ Returns the number of seconds a Retry-After header asks to wait """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HostBudget:
+    """ Token bucket for a single host, a rate of None means unlimited """
+
+    def __init__(self, rate: Optional[float], burst: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """ Per-host token buckets shared by every thread, adjusted by how the servers respond """
+
+    def __init__(self, rate: float, burst: float):
+        self.default_rate = rate
+        self.default_burst = burst
+        self.lock = threading.Lock()
+        self.budgets = {}
+
+    def set_budget(self, host: str, rate: Optional[float], burst: float) -> None:
+        with self.lock:
+            self.budgets[host] = HostBudget(rate, burst)
+
+    def copy_budget(self, host: str, new_host: str) -> None:
+        """ Gives new_host a fresh budget with the limits of host """
+        with self.lock:
+            budget = self._get_budget(host)
+            self.budgets[new_host] = HostBudget(budget.max_rate, budget.burst)
+
+    def _get_budget(self, host: str) -> HostBudget:
+        if host not in self.budgets:
+            self.budgets[host] = HostBudget(self.default_rate, self.default_burst)
+        return self.budgets[host]
+
+    def reserve(self, host: str) -> float:
+        """ Takes a token for host without blocking, returns how long the caller has to wait before using it """
+        with self.lock:
+            budget = self._get_budget(host)
+            if budget.rate is None:
+                return 0.0
+            now = time.monotonic()
+            budget.refill(now)
+            # tokens may go negative, every reservation in debt waits for its own refill
+            budget.tokens -= 1
+            return max(budget.blocked_until - now, -budget.tokens / budget.rate, 0.0)
+
+    def acquire(self, host: str) -> float:
+        """ Blocks until host may be contacted again, returns the time spent waiting """
+        wait = self.reserve(host)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_response(self, host: str, status: int, retry_after: Optional[float] = None) -> bool:
+        """ Feeds a response status back into the budget of host, returns True if it was throttled """
+        throttled = status == 429 or status >= 500
+        with self.lock:
+            budget = self._get_budget(host)
+            if budget.rate is None:
+                return throttled
+            if throttled:
+                budget.rate = max(budget.rate * RATE_DECREASE, MIN_RATE)
+                budget.tokens = min(budget.tokens, 0.0)
+                if retry_after:
+                    budget.blocked_until = max(budget.blocked_until, time.monotonic() + retry_after)
+            else:
+                budget.rate = min(budget.rate + RATE_INCREASE, budget.max_rate)
+        return throttled
+
+
+def parse_bandwidth_schedule(value: str) -> List[Tuple[int, Optional[float]]]:
+    """ Parses a BANDWIDTH_LIMIT of KB/s, or of HH:MM=KB/s entries separated by commas that each apply from their
+        time of day on, into (minute of the day, bytes per second or None for unlimited) sorted by time """
+    schedule = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        minute = 0
+        if '=' in entry:
+            start, entry = entry.split('=', 1)
+            try:
+                hours, minutes = start.strip().split(':')
+                minute = int(hours) * 60 + int(minutes)
+            except ValueError:
+                raise ValueError(f'Invalid bandwidth schedule time "{start}", expected HH:MM')
+        try:
+            rate = float(entry)
+        except ValueError:
+            raise ValueError(f'Invalid bandwidth limit "{entry}", expected KB/s')
+        schedule.append((minute, rate * 1024 if rate > 0 else None))
+    return sorted(schedule)
+
+
+class BandwidthShare:
+    """ One download's part of a BandwidthLimiter, optionally capped at a rate of its own. Several threads of the
+        same download may share it """
+
+    def __init__(self, limiter: 'BandwidthLimiter', rate: Optional[float]):
+        self.limiter = limiter
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def throttle(self, size: int) -> float:
+        """ Accounts for size bytes just read, sleeps as long as the limits ask, returns the time slept """
+        wait = self.limiter.consume(size)
+        rate = self.limiter.get_fair_share()
+        if self.rate is not None:
+            rate = self.rate if rate is None else min(rate, self.rate)
+        if rate is not None:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(rate * self.limiter.burst, self.tokens + (now - self.updated) * rate) - size
+                self.updated = now
+                wait = max(wait, -self.tokens / rate)
+        else:
+            self.updated = time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        return max(wait, 0.0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.limiter.release()
+
+
+class BandwidthLimiter:
+    """ Byte budget shared by every download of the process, following a static rate or a time-of-day schedule.
+        Each running download may use at most an equal share of it """
+
+    def __init__(self, schedule: List[Tuple[int, Optional[float]]], burst: float):
+        self.schedule = schedule
+        # seconds of the current rate that may be used at once after an idle moment
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.streams = 0
+        # bytes counted since measured_at, turned into the effective rate about once a second
+        self.counted = 0
+        self.measured_at = time.monotonic()
+        self.effective_rate = 0.0
+
+    def get_rate(self) -> Optional[float]:
+        """ Returns the bytes per second allowed right now, None when unlimited """
+        if not self.schedule:
+            return None
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        # the last entry of the day is still in effect after midnight until the first one starts
+        rate = self.schedule[-1][1]
+        for start, entry_rate in self.schedule:
+            if start > minute:
+                break
+            rate = entry_rate
+        return rate
+
+    def get_fair_share(self) -> Optional[float]:
+        rate = self.get_rate()
+        return None if rate is None else rate / max(self.streams, 1)
+
+    def open(self, rate: Optional[float] = None) -> BandwidthShare:
+        """ Registers a download, use the returned share as a context manager around it """
+        with self.lock:
+            self.streams += 1
+        return BandwidthShare(self, rate)
+
+    def release(self) -> None:
+        with self.lock:
+            self.streams -= 1
+
+    def consume(self, size: int) -> float:
+        """ Takes size bytes from the budget, returns how long the caller has to wait before reading more """
+        rate = self.get_rate()
+        with self.lock:
+            now = time.monotonic()
+            self.counted += size
+            if now - self.measured_at >= 1:
+                self.effective_rate = self.counted / (now - self.measured_at)
+                self.counted = 0
+                self.measured_at = now
+            if rate is None:
+                self.updated = now
+                return 0.0
+            # tokens may go negative, every download in debt waits for its own refill
+            self.tokens = min(rate * self.burst, self.tokens + (now - self.updated) * rate) - size
+            self.updated = now
+            return max(-self.tokens / rate, 0.0)
+
+    def describe(self) -> str:
+        """ Returns the effective rate of all downloads against the current limit, empty when unlimited """
+        rate = self.get_rate()
+        if rate is None:
+            return ''
+        if time.monotonic() - self.measured_at > 2:
+            # nothing was read for a while
+            self.effective_rate = 0.0
+        return f'all {self.effective_rate / 1024:.0f}/{rate / 1024:.0f}KB/s'
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from pathlib import Path, PurePath
+from typing import Optional
+
+from zotify.cache import normalize_url
+
+# headers worth keeping in a fixture, everything else is noise between recordings
+RECORDED_HEADERS = ('Content-Type', 'Retry-After')
+
+
+def get_fixture_name(url: str, params: Optional[dict] = None) -> str:
+    return hashlib.sha1(normalize_url(url, params).encode('utf-8')).hexdigest() + '.json'
+
+
+class ReplayResponse:
+    """ The parts of a requests.Response that Zotify reads, rebuilt from a fixture """
+
+    def __init__(self, url: str, status_code: int, text: str, headers: Optional[dict] = None):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.headers = headers or {}
+        self.http_version = 'REPLAY'
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class Recorder:
+    """ Writes every Web API response into a fixture directory """
+
+    def __init__(self, fixture_dir):
+        self.fixture_dir = Path(fixture_dir).expanduser()
+        self.fixture_dir.mkdir(parents=True, exist_ok=True)
+
+    def record(self, url: str, params: Optional[dict], response) -> None:
+        fixture_path = self.fixture_dir / get_fixture_name(url, params)
+        fixture = {
+            'url': normalize_url(url, params),
+            'status': response.status_code,
+            'headers': {key: response.headers[key] for key in RECORDED_HEADERS if key in response.headers},
+            'body': response.text,
+        }
+        temp_path = PurePath(f'{fixture_path}.{threading.get_ident()}.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(fixture, file, ensure_ascii=False, indent=1)
+        Path(temp_path).replace(fixture_path)
+
+
+class ReplayTransport:
+    """ Serves recorded fixtures instead of contacting Spotify, with injectable latency, 429s and errors.
+        Faults are drawn from the seed, the request and how often it was made before, so a run
+        replays identically even when requests race each other """
+
+    def __init__(self, fixture_dir, latency_ms: int = 0, rate_limit_percent: int = 0, error_percent: int = 0, seed: int = 0):
+        self.fixture_dir = Path(fixture_dir).expanduser()
+        self.latency = latency_ms / 1000
+        self.rate_limit_chance = rate_limit_percent / 100
+        self.error_chance = error_percent / 100
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.request_counts = {}
+
+    def _get_random(self, name: str) -> random.Random:
+        with self.lock:
+            count = self.request_counts.get(name, 0)
+            self.request_counts[name] = count + 1
+        return random.Random(f'{self.seed}:{name}:{count}')
+
+    def request(self, method, url, params=None, **kwargs) -> ReplayResponse:
+        name = get_fixture_name(url, params)
+        rng = self._get_random(name)
+        if self.latency:
+            time.sleep(self.latency * rng.uniform(0.5, 1.5))
+
+        roll = rng.random()
+        if roll < self.rate_limit_chance:
+            return ReplayResponse(url, 429, json.dumps({'error': {'status': 429, 'message': 'API rate limit exceeded (injected)'}}),
+                                  {'Retry-After': '1'})
+        if roll < self.rate_limit_chance + self.error_chance:
+            status = rng.choice((500, 502, 503))
+            return ReplayResponse(url, status, json.dumps({'error': {'status': status, 'message': 'Server error (injected)'}}))
+
+        fixture_path = self.fixture_dir / name
+        if not fixture_path.is_file():
+            return ReplayResponse(url, 404, json.dumps({'error': {'status': 404, 'message': f'No fixture recorded for {url}'}}))
+        with open(fixture_path, 'r', encoding='utf-8') as file:
+            fixture = json.load(file)
+        return ReplayResponse(url, fixture['status'], fixture['body'], fixture['headers'])
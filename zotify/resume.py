@@ -0,0 +1,109 @@
+import json
+import threading
+from pathlib import Path
+from typing import Optional
+
+# bytes written between two updates of the sidecar
+SIDECAR_INTERVAL = 1024 * 1024
+
+
+class PartialDownload:
+    """ Download kept at <path>.part with a <path>.part.json sidecar naming what it is and how far it got,
+        so an interrupted download continues where it stopped instead of starting from byte zero """
+    # paths that a download of this process is writing to, see lease
+    _leased = set()
+    _lease_lock = threading.Lock()
+
+    @classmethod
+    def lease(cls, path) -> bool:
+        """ Claims path for one download, returns False while another download of this process holds it """
+        with cls._lease_lock:
+            if str(path) in cls._leased:
+                return False
+            cls._leased.add(str(path))
+            return True
+
+    @classmethod
+    def release(cls, path) -> None:
+        with cls._lease_lock:
+            cls._leased.discard(str(path))
+
+    def __init__(self, path, content_id: str, file_id: Optional[str] = None):
+        self.part_path = Path(f'{path}.part')
+        self.sidecar_path = Path(f'{path}.part.json')
+        self.content_id = content_id
+        self.file_id = file_id
+        self.expected_size = None
+        self.written = 0
+        self.checkpoint = 0
+        self.file = None
+
+    def load(self, expected_size: Optional[int] = None) -> int:
+        """ Returns how many bytes of an earlier attempt can be kept, discarding it if it was for other content
+            or, when expected_size is given, a file of another size """
+        try:
+            with open(self.sidecar_path, 'r', encoding='utf-8') as file:
+                sidecar = json.load(file)
+            size = self.part_path.stat().st_size
+        except (OSError, ValueError):
+            return 0
+        if (sidecar.get('content_id') != self.content_id or sidecar.get('file_id') != self.file_id
+                or (expected_size is not None and sidecar.get('expected_size') != expected_size)):
+            return 0
+        self.expected_size = sidecar.get('expected_size')
+        # whatever reached the disk before the sidecar was last updated is valid, anything later is not known to be
+        written = min(size, int(sidecar.get('written', 0)))
+        if self.expected_size and written > self.expected_size:
+            return 0
+        return written
+
+    def open(self, expected_size: int, offset: int = 0):
+        """ Prepares the partial file for writing from offset on, use it as a context manager """
+        self.expected_size = expected_size
+        self.written = self.checkpoint = offset
+        return self
+
+    def write(self, data: bytes) -> int:
+        written = self.file.write(data)
+        self.written += written
+        if self.written - self.checkpoint >= SIDECAR_INTERVAL:
+            self.file.flush()
+            self._save_sidecar()
+        return written
+
+    def _save_sidecar(self) -> None:
+        temp_path = Path(f'{self.sidecar_path}.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'content_id': self.content_id, 'file_id': self.file_id,
+                       'expected_size': self.expected_size, 'written': self.written}, file)
+        temp_path.replace(self.sidecar_path)
+        self.checkpoint = self.written
+
+    def __enter__(self):
+        self.part_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.written:
+            self.file = open(self.part_path, 'r+b')
+            self.file.truncate(self.written)
+            self.file.seek(self.written)
+        else:
+            self.file = open(self.part_path, 'wb')
+        self._save_sidecar()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.file.close()
+        self._save_sidecar()
+
+    @staticmethod
+    def discard(path) -> None:
+        """ Removes the partial file of path and its sidecar """
+        for leftover in (f'{path}.part', f'{path}.part.json', f'{path}.part.json.tmp'):
+            Path(leftover).unlink(missing_ok=True)
+
+    def commit(self, path) -> None:
+        """ Moves the finished download to path, raises if it is shorter or longer than expected """
+        size = self.part_path.stat().st_size
+        if self.expected_size and size != self.expected_size:
+            raise IOError(f'Download incomplete, got {size} of {self.expected_size} bytes, it is retried on the next run')
+        self.part_path.replace(path)
+        self.sidecar_path.unlink(missing_ok=True)
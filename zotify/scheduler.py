@@ -0,0 +1,102 @@
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# how the containers waiting with the same priority take turns, smaller keys go first
+SCHEDULING_POLICIES: Dict[str, Callable] = {
+    # in the order the containers arrived
+    'fifo': lambda container: (-container.priority, container.arrival),
+    # the container that started a download the longest time ago
+    'round-robin': lambda container: (-container.priority, container.last_started, container.arrival),
+    # the container with the fewest downloads left
+    'sjf': lambda container: (-container.priority, container.remaining(), container.arrival),
+}
+
+
+class Container:
+    """ Downloads that are scheduled as one, like a daemon job or a url of a -d file """
+    _arrivals = itertools.count()
+
+    def __init__(self, name: str, priority: int = 0, size: int = 0):
+        self.name = name
+        self.priority = priority
+        # the number of downloads the container is expected to start, 0 if that is not known
+        self.size = size
+        self.started = 0
+        self.last_started = -1
+        self.arrival = next(Container._arrivals)
+
+    def remaining(self) -> int:
+        return max(self.size - self.started, 1)
+
+
+# downloads submitted outside of any container
+DEFAULT_CONTAINER = Container('default')
+
+
+class Scheduler:
+    """ Hands the free download slots to the containers waiting for one, higher priorities first and the rest
+        by a SCHEDULING_POLICY, so a small request does not wait behind a large backfill """
+    _local = threading.local()
+
+    def __init__(self, slots: int, policy: str):
+        if policy not in SCHEDULING_POLICIES:
+            raise ValueError(f'Unknown SCHEDULING_POLICY {policy}, use one of {", ".join(SCHEDULING_POLICIES)}')
+        self.free = max(slots, 1)
+        self.key = SCHEDULING_POLICIES[policy]
+        self.ticks = itertools.count()
+        # one entry per submit that waits for a slot
+        self.waiting: List[Container] = []
+        self.condition = threading.Condition()
+
+    @classmethod
+    def current(cls) -> Container:
+        """ Returns the container the calling thread works for """
+        return getattr(cls._local, 'container', None) or DEFAULT_CONTAINER
+
+    @classmethod
+    @contextmanager
+    def use(cls, container: Optional[Container]):
+        """ Makes container the one the calling thread works for, until the with block ends """
+        previous = getattr(cls._local, 'container', None)
+        cls._local.container = container
+        try:
+            yield container
+        finally:
+            cls._local.container = previous
+
+    def acquire(self, container: Container) -> None:
+        """ Blocks until a slot is free and no waiting container goes before container """
+        with self.condition:
+            self.waiting.append(container)
+            try:
+                while not (self.free and min(self.waiting, key=self.key) is container):
+                    self.condition.wait()
+            finally:
+                self.waiting.remove(container)
+            self.free -= 1
+            container.started += 1
+            container.last_started = next(self.ticks)
+            # the next container in line may fit into another free slot
+            self.condition.notify_all()
+
+    def release(self) -> None:
+        with self.condition:
+            self.free += 1
+            self.condition.notify_all()
+
+
+def schedule(containers: List[Tuple[Container, list]], policy: str) -> Iterator:
+    """ Yields the items of every container in the order policy starts them when they all wait at once """
+    key = SCHEDULING_POLICIES[policy]
+    ticks = itertools.count()
+    pending = [(container, deque(items)) for container, items in containers if items]
+    while pending:
+        container, items = min(pending, key=lambda entry: key(entry[0]))
+        container.started += 1
+        container.last_started = next(ticks)
+        yield items.popleft()
+        if not items:
+            pending.remove((container, items))
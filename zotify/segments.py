@@ -0,0 +1,151 @@
+import json
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import requests
+
+from zotify.httpclient import HttpClient
+from zotify.resume import PartialDownload, SIDECAR_INTERVAL
+from zotify.streaming import StreamPump
+from zotify.termoutput import Printer, PrintChannel
+from zotify.zotify import Zotify
+
+# files are only split when every segment gets at least this much
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+
+
+def probe_ranges(url) -> Optional[Tuple[str, int]]:
+    """ Returns the url behind any redirects and the size of the file when the server serves byte ranges of it """
+    try:
+        r = HttpClient.head(url, allow_redirects=True)
+    except requests.RequestException:
+        return None
+    # ranges of an encoded response would be ranges of the encoded bytes
+    if not r.ok or r.headers.get('Accept-Ranges', '').lower() != 'bytes' or r.headers.get('Content-Encoding'):
+        return None
+    size = int(r.headers.get('Content-Length', 0))
+    return (r.url, size) if size else None
+
+
+def get_segment_count(size: int) -> int:
+    return max(min(Zotify.CONFIG.get_download_segments(), size // SEGMENT_MIN_SIZE), 1)
+
+
+class SegmentedDownload:
+    """ Fetches byte ranges of one file over parallel connections straight into their place in a preallocated
+        <path>.part, whose sidecar records how far every segment got so an interrupted download continues """
+
+    def __init__(self, url: str, path, size: int, content_id: str):
+        self.url = url
+        self.size = size
+        self.partial = PartialDownload(path, content_id)
+        self.partial.expected_size = size
+        # [start, end, done] with end exclusive and done counted from start
+        self.segments: List[List[int]] = []
+        self.lock = threading.Lock()
+        self.unsaved = 0
+
+    def load(self, count: int) -> int:
+        """ Picks up the segments of an earlier attempt at the same file, or splits it into count new ones.
+            Returns the bytes already downloaded """
+        try:
+            with open(self.partial.sidecar_path, 'r', encoding='utf-8') as file:
+                sidecar = json.load(file)
+            if (sidecar.get('content_id') == self.partial.content_id and sidecar.get('expected_size') == self.size
+                    and sidecar.get('segments') and self.partial.part_path.stat().st_size == self.size):
+                self.segments = [list(segment) for segment in sidecar['segments']]
+                return sum(done for _, _, done in self.segments)
+        except (OSError, ValueError):
+            pass
+        length = math.ceil(self.size / count)
+        self.segments = [[start, min(start + length, self.size), 0] for start in range(0, self.size, length)]
+        return 0
+
+    def _save_sidecar(self) -> None:
+        temp_path = Path(f'{self.partial.sidecar_path}.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'content_id': self.partial.content_id, 'file_id': None, 'expected_size': self.size,
+                       'segments': self.segments}, file)
+        temp_path.replace(self.partial.sidecar_path)
+
+    def run(self, on_progress=None, throttle=None) -> None:
+        """ Downloads every unfinished segment, re-raising the first error once all of them stopped.
+            The segments share one throttle, so together they count as one download """
+        part_path = self.partial.part_path
+        part_path.parent.mkdir(parents=True, exist_ok=True)
+        if not part_path.exists() or part_path.stat().st_size != self.size:
+            with open(part_path, 'wb') as file:
+                file.truncate(self.size)
+        self._save_sidecar()
+
+        progress_lock = threading.Lock()
+
+        def report(n):
+            with progress_lock:
+                on_progress(n)
+
+        pending = [segment for segment in self.segments if segment[0] + segment[2] < segment[1]]
+        try:
+            with ThreadPoolExecutor(max(len(pending), 1), thread_name_prefix='zotify-segment',
+                                    initializer=Printer.set_background_thread) as executor:
+                futures = [executor.submit(self._fetch, segment, report if on_progress else None, throttle)
+                           for segment in pending]
+            for future in futures:
+                future.result()
+        finally:
+            with self.lock:
+                self._save_sidecar()
+
+    def _fetch(self, segment: List[int], on_progress, throttle) -> None:
+        retries = Zotify.CONFIG.get_stream_retries()
+        for attempt in range(retries + 1):
+            start, end, done = segment
+            if start + done >= end:
+                return
+            try:
+                self._fetch_range(segment, on_progress, throttle)
+                return
+            except (IOError, requests.RequestException) as e:
+                if attempt == retries:
+                    raise
+                Printer.print(PrintChannel.WARNINGS, f'###   Segment {start}-{end}: {e}, retrying from byte '
+                                                     f'{start + segment[2]} ({attempt + 1}/{retries})   ###')
+
+    def _fetch_range(self, segment: List[int], on_progress, throttle) -> None:
+        start, end, done = segment
+        r = HttpClient.get(self.url, stream=True, headers={'Range': f'bytes={start + done}-{end - 1}'})
+        with r:
+            if r.status_code != 206 or not r.headers.get('Content-Range', '').startswith(f'bytes {start + done}-'):
+                raise IOError(f'Server answered a range request with status {r.status_code}')
+
+            with open(self.partial.part_path, 'r+b') as file:
+                file.seek(start + done)
+
+                def write(data) -> int:
+                    written = file.write(data)
+                    # whatever a segment counts as done has to be in the file already
+                    file.flush()
+                    with self.lock:
+                        segment[2] += written
+                        self.unsaved += written
+                        if self.unsaved >= SIDECAR_INTERVAL:
+                            self._save_sidecar()
+                            self.unsaved = 0
+                    return written
+
+                pump = StreamPump(write, Zotify.CONFIG.get_chunk_size(), on_progress=on_progress, throttle=throttle,
+                                  stall_timeout=Zotify.CONFIG.get_stream_stall_timeout(),
+                                  min_throughput=Zotify.CONFIG.get_min_stream_throughput())
+                copied = pump.copy(readinto=r.raw.readinto, limit=end - start - done)
+        if copied != end - start - done:
+            raise IOError(f'Segment ended early, got {copied} of {end - start - done} bytes')
+
+    def commit(self, path) -> None:
+        """ Moves the finished file to path, raises while any segment is missing bytes """
+        missing = sum(end - start - done for start, end, done in self.segments)
+        if missing:
+            raise IOError(f'Download incomplete, {missing} of {self.size} bytes missing, it is retried on the next run')
+        self.partial.commit(path)
@@ -0,0 +1,147 @@
+import glob
+import threading
+import time
+from typing import List, Optional
+
+from librespot.core import Session
+
+from zotify.httpclient import HttpClient
+from zotify.ratelimit import CONTENT_HOST
+
+# consecutive failed stream loads after which a session is logged in again
+MAX_FAILURES = 3
+# a failed load rests the session this long, doubled with every further failure up to MAX_BACKOFF
+BACKOFF = 2
+MAX_BACKOFF = 60
+
+
+def create_session(credentials_file: str) -> Session:
+    conf = Session.Configuration.Builder().set_store_credentials(False).build()
+    return Session.Builder(conf).stored_file(credentials_file).create()
+
+
+class PooledSession:
+    """ One logged in account of the SessionPool and how it has been doing lately """
+
+    def __init__(self, name: str, session: Optional[Session], credentials_file: Optional[str]):
+        self.name = name
+        # None while the session is being replaced
+        self.session = session
+        self.credentials_file = credentials_file
+        # every account gets its own content budget in the rate limiter
+        self.host = f'{CONTENT_HOST}:{name}'
+        self.streams = 0
+        self.loaded = 0
+        self.failures = 0
+        self.resting_until = 0.0
+
+    def is_available(self, now: float) -> bool:
+        return self.session is not None and self.resting_until <= now
+
+
+class SessionPool:
+    """ Librespot sessions of the main account and of every CREDENTIALS_POOL file. Content streams are leased from
+        the least busy healthy session, a session that keeps failing is logged in again in the background """
+    SESSIONS: List[PooledSession] = []
+    _condition = threading.Condition()
+
+    @classmethod
+    def setup(cls, main_session: Session, main_credentials_file: Optional[str], credentials_pool: str) -> None:
+        # we need to import that here, otherwise we will get circular imports!
+        from zotify.termoutput import Printer, PrintChannel
+        sessions = [PooledSession('main', main_session, main_credentials_file)]
+        files = []
+        for pattern in credentials_pool.split(','):
+            if pattern.strip():
+                files += sorted(glob.glob(pattern.strip())) or [pattern.strip()]
+        for index, credentials_file in enumerate(files, 1):
+            if credentials_file == main_credentials_file:
+                continue
+            try:
+                session = create_session(credentials_file)
+            except Exception as e:
+                Printer.print(PrintChannel.WARNINGS, f'###   Could not log in with {credentials_file}: {e}   ###')
+                continue
+            sessions.append(PooledSession(str(index), session, credentials_file))
+
+        limiter = HttpClient.get_rate_limiter()
+        for pooled in sessions:
+            limiter.copy_budget(CONTENT_HOST, pooled.host)
+        with cls._condition:
+            cls.SESSIONS = sessions
+        if len(sessions) > 1:
+            Printer.print(PrintChannel.PROGRESS_INFO, f'Streaming with {len(sessions)} accounts')
+
+    @classmethod
+    def size(cls) -> int:
+        return len(cls.SESSIONS)
+
+    @classmethod
+    def lease(cls) -> PooledSession:
+        """ Returns the healthy session with the fewest streams open, waits while all of them are resting """
+        with cls._condition:
+            while True:
+                now = time.monotonic()
+                available = [pooled for pooled in cls.SESSIONS if pooled.is_available(now)]
+                if available:
+                    pooled = min(available, key=lambda p: (p.streams, p.loaded))
+                    pooled.streams += 1
+                    return pooled
+                if not cls.SESSIONS:
+                    raise RuntimeError('No Spotify session is logged in')
+                resting = [pooled.resting_until - now for pooled in cls.SESSIONS if pooled.session is not None]
+                # replaced sessions notify once they are back
+                cls._condition.wait(max(min(resting), 0.1) if resting else MAX_BACKOFF)
+
+    @classmethod
+    def release(cls, pooled: PooledSession) -> None:
+        with cls._condition:
+            pooled.streams -= 1
+            cls._condition.notify_all()
+
+    @classmethod
+    def report(cls, pooled: PooledSession, ok: bool) -> None:
+        """ Records whether loading a stream from pooled worked, resting or replacing it when it does not """
+        with cls._condition:
+            if ok:
+                pooled.failures = 0
+                pooled.loaded += 1
+                return
+            pooled.failures += 1
+            pooled.resting_until = time.monotonic() + min(BACKOFF * 2 ** (pooled.failures - 1), MAX_BACKOFF)
+            session = pooled.session
+            if session is None or (pooled.failures < MAX_FAILURES and session.is_valid()):
+                return
+            pooled.session = None
+        threading.Thread(target=cls._replace, args=(pooled, session), name=f'zotify-session-{pooled.name}',
+                         daemon=True).start()
+
+    @classmethod
+    def _replace(cls, pooled: PooledSession, session: Session) -> None:
+        # we need to import that here, otherwise we will get circular imports!
+        from zotify.termoutput import Printer, PrintChannel
+        from zotify.zotify import Zotify
+        Printer.print(PrintChannel.WARNINGS, f'###   Session {pooled.name} keeps failing, logging in again   ###')
+        while True:
+            try:
+                if pooled.credentials_file:
+                    try:
+                        session.close()
+                    except Exception:
+                        pass
+                    session = create_session(pooled.credentials_file)
+                else:
+                    # logged in with a password that was not stored, the session can only reconnect
+                    session.reconnect()
+                break
+            except Exception as e:
+                Printer.print(PrintChannel.WARNINGS, f'###   Session {pooled.name} could not log in again: {e}   ###')
+                time.sleep(MAX_BACKOFF)
+
+        if pooled.name == 'main':
+            Zotify.SESSION = session
+        with cls._condition:
+            pooled.session = session
+            pooled.failures = 0
+            pooled.resting_until = 0.0
+            cls._condition.notify_all()
@@ -0,0 +1,208 @@
+import collections
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+# librespot decrypts content in chunks of this size, reads that stay inside one are a single slice
+CONTENT_CHUNK_SIZE = 128 * 1024
+MAX_READ_SIZE = 1024 * 1024
+# the read size is adapted so a read takes about this long at the measured throughput
+TARGET_READ_TIME = 0.05
+# progress is reported at most this often
+PROGRESS_INTERVAL = 0.1
+# buffers in flight between the reader and the writer
+BUFFERS = 3
+# a source that returns nothing this many times in a row has ended, even if it is shorter than expected
+EMPTY_READS = 5
+# how often the watchdog looks at the stream, and over how long it averages the throughput
+WATCHDOG_INTERVAL = 0.5
+THROUGHPUT_WINDOW = 15
+
+
+class StreamStalledError(IOError):
+    pass
+
+
+def close_content_stream(stream) -> None:
+    """ Closes a librespot chunked stream and releases a reader blocked on one of its chunks """
+    stream.close()
+    # close only notifies, a reader waits until its chunk is available, so every missing chunk is marked as such.
+    # The reader then sees the stream is closed and fails instead of waiting for data that is not coming
+    with stream.wait_lock:
+        available = stream.available_chunks()
+        for index in range(len(available)):
+            available[index] = True
+        stream.wait_lock.notify_all()
+
+
+class ChunkSizer:
+    """ Picks read sizes from the measured throughput, between the configured chunk size and MAX_READ_SIZE """
+
+    def __init__(self, minimum: int, maximum: int = MAX_READ_SIZE):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.size = self.minimum
+        self.throughput = None
+
+    def record(self, read: int, elapsed: float) -> None:
+        if read <= 0:
+            return
+        rate = read / max(elapsed, 1e-6)
+        self.throughput = rate if self.throughput is None else 0.8 * self.throughput + 0.2 * rate
+        self.size = int(min(max(self.throughput * TARGET_READ_TIME, self.minimum), self.maximum))
+
+
+class StreamPump:
+    """ Copies a stream with the reads and the writes on two threads, so the disk and the network overlap, while the
+        calling thread watches for stalls. Sources with a working readinto fill a few reusable buffers instead of
+        new bytes objects """
+
+    def __init__(self, write: Callable[[memoryview], int], chunk_size: int,
+                 on_progress: Optional[Callable[[int], None]] = None, throttle: Optional[Callable[[int], None]] = None,
+                 stall_timeout: float = 0, min_throughput: float = 0):
+        self.write = write
+        self.sizer = ChunkSizer(chunk_size)
+        self.on_progress = on_progress
+        # called with the size of every read, may sleep to slow the reader down and returns the time it slept
+        self.throttle = throttle
+        # seconds without any data, and bytes per second over THROUGHPUT_WINDOW, before the stream is given up
+        self.stall_timeout = stall_timeout
+        self.min_throughput = min_throughput
+        self.filled = queue.Queue(maxsize=BUFFERS)
+        self.free = queue.Queue()
+        self.error = None
+        self.aborted = False
+        self.copied = 0
+        self.throttled = 0.0
+        self.last_read = time.monotonic()
+
+    def copy(self, read: Callable[[int], bytes] = None, readinto: Callable[[memoryview], int] = None,
+             limit: Optional[int] = None, position: int = 0) -> int:
+        """ Copies limit bytes, or until the source ends when limit is None, returns the bytes copied.
+            position is where a librespot stream currently is, reads are cut at its chunk boundaries """
+        if readinto is not None:
+            for _ in range(BUFFERS + 1):
+                self.free.put(bytearray(self.sizer.maximum))
+        reader = threading.Thread(target=self._fill, args=(read, readinto, limit, position), name='zotify-reader', daemon=True)
+        writer = threading.Thread(target=self._drain, name='zotify-writer', daemon=True)
+        reader.start()
+        writer.start()
+
+        samples = collections.deque()
+        while writer.is_alive():
+            writer.join(WATCHDOG_INTERVAL)
+            if writer.is_alive() and self.error is None:
+                self._watch(samples)
+        if self.error is not None:
+            raise self.error
+        return self.copied
+
+    def _watch(self, samples: collections.deque) -> None:
+        now = time.monotonic()
+        if self.stall_timeout and now - self.last_read > self.stall_timeout:
+            self._abort(StreamStalledError(f'Stream stalled, no data for {self.stall_timeout:.0f}s'))
+            return
+        if not self.min_throughput:
+            return
+        samples.append((now, self.copied, self.throttled))
+        while now - samples[0][0] > THROUGHPUT_WINDOW:
+            oldest = samples.popleft()
+            # time the throttle held the stream back on purpose does not count against it
+            elapsed = now - oldest[0] - (self.throttled - oldest[2])
+            if elapsed < WATCHDOG_INTERVAL:
+                continue
+            throughput = (self.copied - oldest[1]) / elapsed
+            if throughput < self.min_throughput:
+                self._abort(StreamStalledError(f'Stream too slow, {throughput / 1024:.1f}KB/s over the last '
+                                               f'{THROUGHPUT_WINDOW}s'))
+                return
+
+    def _abort(self, error: Exception) -> None:
+        if self.error is not None:
+            return
+        # a read blocked inside the source can not be interrupted here, the caller releases it once copy returns
+        self.error = error
+        self.aborted = True
+
+    def _fill(self, read, readinto, limit, position) -> None:
+        empty = 0
+        try:
+            while empty < EMPTY_READS and not self.aborted and (limit is None or self.copied < limit):
+                size = self.sizer.size
+                if limit is not None:
+                    size = min(size, limit - self.copied)
+                if readinto is None:
+                    size = min(size, CONTENT_CHUNK_SIZE - (position + self.copied) % CONTENT_CHUNK_SIZE)
+                time_start = time.monotonic()
+                if readinto is not None:
+                    buffer = self._get_free()
+                    if buffer is None:
+                        break
+                    n = readinto(memoryview(buffer)[:size])
+                    data = memoryview(buffer)[:n]
+                else:
+                    buffer = None
+                    data = read(size)
+                    n = len(data)
+                self.sizer.record(n, time.monotonic() - time_start)
+                if n == 0:
+                    if buffer is not None:
+                        self.free.put(buffer)
+                    empty += 1
+                    continue
+                empty = 0
+                self.copied += n
+                self.last_read = time.monotonic()
+                self._put((data, buffer))
+                if self.throttle:
+                    self.throttled += self.throttle(n)
+                    self.last_read = time.monotonic()
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+        finally:
+            self._put(None)
+
+    def _get_free(self) -> Optional[bytearray]:
+        """ Returns a buffer the writer is done with, or None once the copy was aborted """
+        while not self.aborted:
+            try:
+                return self.free.get(timeout=WATCHDOG_INTERVAL)
+            except queue.Empty:
+                pass
+        return None
+
+    def _put(self, item) -> None:
+        while not self.aborted:
+            try:
+                self.filled.put(item, timeout=WATCHDOG_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def _drain(self) -> None:
+        pending = 0
+        last_report = time.monotonic()
+        while not self.aborted:
+            try:
+                item = self.filled.get(timeout=WATCHDOG_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            data, buffer = item
+            try:
+                pending += self.write(data)
+            except Exception as e:
+                # nothing more can be written, so stop the reader too
+                self._abort(e)
+            finally:
+                if buffer is not None:
+                    self.free.put(buffer)
+            if self.on_progress and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                self.on_progress(pending)
+                pending = 0
+                last_report = time.monotonic()
+        if self.on_progress and pending:
+            self.on_progress(pending)
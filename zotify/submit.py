@@ -0,0 +1,56 @@
+import json
+
+import requests
+
+from zotify.config import Config
+
+
+def submit(args) -> int:
+    """ Hands the urls, -l or -f of args to a running zotify --serve and prints its progress, returns the exit code """
+    if args.urls:
+        request = {'urls': args.urls}
+    elif args.liked_songs:
+        request = {'liked': True}
+    elif args.followed_artists:
+        request = {'followed': True}
+    else:
+        print('Error: --submit needs urls, -d, -l or -f')
+        return 2
+    if args.priority:
+        request['priority'] = args.priority
+
+    try:
+        with open(Config.get_serve_token_location(), 'r', encoding='utf-8') as file:
+            headers = {'Authorization': f'Bearer {file.read().strip()}'}
+    except OSError:
+        print(f'Error: no daemon token at {Config.get_serve_token_location()}, start a daemon with zotify --serve')
+        return 1
+
+    base_url = f'http://127.0.0.1:{Config.get_serve_port()}'
+    try:
+        response = requests.post(f'{base_url}/jobs', json=request, headers=headers,
+                                 timeout=Config.get_http_connect_timeout())
+    except requests.ConnectionError:
+        print(f'Error: no zotify daemon is listening on port {Config.get_serve_port()}, start one with zotify --serve')
+        return 1
+    if response.status_code != 202:
+        print(f'Error: the daemon refused the job: {response.json().get("error")}')
+        return 1
+    job = response.json()
+    print(f'Submitted job {job["id"]}')
+
+    # jobs may stay quiet for a long time, the daemon sends heartbeats instead of the client timing out
+    with requests.get(f'{base_url}/jobs/{job["id"]}/events', stream=True, headers=headers,
+                      timeout=(Config.get_http_connect_timeout(), None)) as events:
+        for line in events.iter_lines():
+            event = json.loads(line)
+            if event['type'] == 'message':
+                print(event['text'])
+            elif event['type'] == 'finished':
+                print(f'\nJob {event["id"]} {event["status"]}: {event["downloaded"]} downloaded, '
+                      f'{event["skipped"]} skipped, {event["failed"]} failed')
+                if event['error']:
+                    print(f'Error: {event["error"]}')
+                return 0 if event['status'] == 'done' and not event['failed'] else 1
+    print('Error: the daemon closed the connection before the job finished')
+    return 1
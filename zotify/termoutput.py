@@ -1,7 +1,9 @@
+import threading
 from enum import Enum
 from tqdm import tqdm
 
 from zotify.config import *
+from zotify.httpclient import HttpClient
 from zotify.zotify import Zotify
 
 
@@ -14,6 +16,7 @@ class PrintChannel(Enum):
     DOWNLOADS = PRINT_DOWNLOADS
     API_ERRORS = PRINT_API_ERRORS
     PROGRESS_INFO = PRINT_PROGRESS_INFO
+    DEBUG = PRINT_DEBUG
 
 
 ERROR_CHANNEL = [PrintChannel.ERRORS, PrintChannel.API_ERRORS]
@@ -22,14 +25,46 @@ ERROR_CHANNEL = [PrintChannel.ERRORS, PrintChannel.API_ERRORS]
 class Printer:
     download_progress = None
     verbose_mode = False
+    # keeps lines from concurrent downloads from interleaving
+    lock = threading.RLock()
+    # download worker threads share the terminal, so they draw no spinners or per-track bars
+    thread_state = threading.local()
+    # called with (kind, value) for every printed message and every finished track, see add_listener
+    listeners = []
+
+    @staticmethod
+    def set_background_thread() -> None:
+        Printer.thread_state.background = True
+
+    @staticmethod
+    def is_background_thread() -> bool:
+        return getattr(Printer.thread_state, 'background', False)
+
+    @staticmethod
+    def is_enabled(channel: PrintChannel) -> bool:
+        return bool(Zotify.CONFIG.get(channel.value))
+
+    @staticmethod
+    def add_listener(listener) -> None:
+        """ Passes ('message', text) for printed messages and ('track', status) for finished tracks to listener """
+        with Printer.lock:
+            Printer.listeners = Printer.listeners + [listener]
+
+    @staticmethod
+    def remove_listener(listener) -> None:
+        with Printer.lock:
+            Printer.listeners = [other for other in Printer.listeners if other is not listener]
 
     @staticmethod
     def print(channel: PrintChannel, msg: str) -> None:
         if Zotify.CONFIG.get(channel.value):
-            if channel in ERROR_CHANNEL:
-                print(msg, file=sys.stderr)
-            else:
-                print(msg)
+            with Printer.lock:
+                if channel in ERROR_CHANNEL:
+                    print(msg, file=sys.stderr)
+                else:
+                    print(msg)
+            for listener in Printer.listeners:
+                listener('message', msg)
 
     @staticmethod
     def print_loader(channel: PrintChannel, msg: str) -> None:
@@ -38,10 +73,22 @@ class Printer:
 
     @staticmethod
     def progress(iterable=None, desc=None, total=None, unit='it', disable=False, unit_scale=False, unit_divisor=1000):
-        if not Zotify.CONFIG.get(PrintChannel.DOWNLOAD_PROGRESS.value):
+        if not Zotify.CONFIG.get(PrintChannel.DOWNLOAD_PROGRESS.value) or Printer.is_background_thread():
             disable = True
         return tqdm(iterable=iterable, desc=desc, total=total, disable=disable, unit=unit, unit_scale=unit_scale, unit_divisor=unit_divisor)
 
+    @staticmethod
+    def bandwidth_progress(p_bar):
+        """ Returns an update function for p_bar that also shows how much of BANDWIDTH_LIMIT all downloads use """
+        limiter = HttpClient.get_bandwidth_limiter()
+
+        def update(n):
+            p_bar.update(n)
+            description = limiter.describe()
+            if description:
+                p_bar.set_postfix_str(description, refresh=False)
+        return update
+
     @staticmethod
     def set_verbose_mode(mode: bool):
         Printer.verbose_mode = mode
@@ -49,17 +96,23 @@ class Printer:
     @staticmethod
     def init_download_progress(total_tracks: int):
         from zotify.track import DownloadProgress
-        Printer.download_progress = DownloadProgress(total_tracks)
+        with Printer.lock:
+            # with several workers the first tracks of a batch race to create it
+            if Printer.download_progress is None:
+                Printer.download_progress = DownloadProgress(total_tracks)
 
     @staticmethod
     def update_download_progress(status: str):
         if Printer.download_progress:
             Printer.download_progress.update(status)
+        for listener in Printer.listeners:
+            listener('track', status)
 
     @staticmethod
     def print_track_info(track_number: int, total_tracks: int, title: str, artist: str, file_size: str, quality: str):
         if Printer.verbose_mode:
-            print(f"[{track_number}/{total_tracks}] Downloading: {title} by {artist} ({file_size}, {quality})")
+            with Printer.lock:
+                print(f"[{track_number}/{total_tracks}] Downloading: {title} by {artist} ({file_size}, {quality})")
 
     @staticmethod
     def print_summary():
@@ -1,23 +1,31 @@
 from pathlib import Path, PurePath
 import math
 import re
+import threading
 import time
 import uuid
+import weakref
+from collections import OrderedDict
 from typing import Any, Tuple, List
 
 from librespot.metadata import TrackId
-import ffmpy
 
 from zotify.const import TRACKS, ALBUM, GENRES, NAME, ITEMS, DISC_NUMBER, TRACK_NUMBER, IS_PLAYABLE, ARTISTS, IMAGES, URL, \
     RELEASE_DATE, ID, TRACKS_URL, FOLLOWED_ARTISTS_URL, SAVED_TRACKS_URL, TRACK_STATS_URL, CODEC_MAP, EXT_MAP, DURATION_MS, \
-    HREF, ARTISTS, WIDTH
+    ARTISTS_URL, WIDTH, API_BATCH_SIZE
 from zotify.termoutput import Printer, PrintChannel
 from zotify.utils import create_download_directory, \
     get_directory_song_ids, add_to_directory_song_ids, get_previously_downloaded, add_to_archive, fmt_seconds
+from zotify.httpclient import HttpClient
 from zotify.zotify import Zotify
 import traceback
 from zotify.loader import Loader
-from zotify.metadata import sanitize_data, get_file_path, set_audio_tags, set_music_thumbnail, conv_artist_format
+from zotify.metadata import sanitize_data, get_file_path, set_audio_tags, set_music_thumbnail, conv_artist_format, \
+    is_ogg_vorbis, get_cover_art
+from zotify.pipeline import run_stages
+from zotify.resume import PartialDownload
+from zotify.streaming import StreamPump, StreamStalledError, close_content_stream
+from zotify.transcode import Transcoder, FFmpegNotFoundError, FFmpegPipe
 from rich.console import Console
 from rich.panel import Panel
 from rich.text import Text
@@ -25,23 +33,84 @@ from rich.progress import Progress
 
 console = Console()
 
+# artist objects by id, shared by every track so each artist is fetched once. It is bounded
+# and its entries age out like /v1/artists does in the metadata cache, as a daemon never exits
+ARTIST_INFO_CACHE_SIZE = 5000
+ARTIST_INFO_TTL = 7 * 24 * 60 * 60
+
+
+class ArtistInfoCache:
+    """ LRU of artist objects by id whose entries expire after ARTIST_INFO_TTL seconds """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # id -> (artist, expires_at) on the monotonic clock, oldest use first
+        self.entries = OrderedDict()
+
+    def get(self, artist_id: str):
+        with self.lock:
+            entry = self.entries.get(artist_id)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self.entries[artist_id]
+                return None
+            self.entries.move_to_end(artist_id)
+            return entry[0]
+
+    def __contains__(self, artist_id: str) -> bool:
+        return self.get(artist_id) is not None
+
+    def __setitem__(self, artist_id: str, artist: dict) -> None:
+        with self.lock:
+            self.entries[artist_id] = (artist, time.monotonic() + self.ttl)
+            self.entries.move_to_end(artist_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+ARTIST_INFO_CACHE = ArtistInfoCache(ARTIST_INFO_CACHE_SIZE, ARTIST_INFO_TTL)
+
+# objects waiting on a set of tracks, like an incremental playlist sync, hear of every track that fails
+# through their on_track_failed(track_ids). They stop listening once nothing else refers to them
+FAILURE_WATCHERS = weakref.WeakSet()
+FAILURE_WATCHERS_LOCK = threading.Lock()
+
+
+def watch_track_failures(watcher) -> None:
+    with FAILURE_WATCHERS_LOCK:
+        FAILURE_WATCHERS.add(watcher)
+
+
+def report_track_failure(*track_ids) -> None:
+    """ Tells the watchers that the track known by any of track_ids failed """
+    with FAILURE_WATCHERS_LOCK:
+        watchers = list(FAILURE_WATCHERS)
+    for watcher in watchers:
+        watcher.on_track_failed(set(track_ids))
+
 class DownloadProgress:
     def __init__(self, total_tracks):
         self.total_tracks = total_tracks
         self.downloaded_tracks = 0
         self.skipped_tracks = 0
         self.failed_tracks = 0
+        # download workers report concurrently
+        self.lock = threading.Lock()
         self.progress = Progress()
         self.task = self.progress.add_task("[cyan]Downloading tracks...", total=total_tracks)
 
     def update(self, status):
-        if status == 'downloaded':
-            self.downloaded_tracks += 1
-        elif status == 'skipped':
-            self.skipped_tracks += 1
-        elif status == 'failed':
-            self.failed_tracks += 1
-        self.progress.update(self.task, advance=1)
+        with self.lock:
+            if status == 'downloaded':
+                self.downloaded_tracks += 1
+            elif status == 'skipped':
+                self.skipped_tracks += 1
+            elif status == 'failed':
+                self.failed_tracks += 1
+            self.progress.update(self.task, advance=1)
 
     def start(self):
         self.progress.start()
@@ -51,19 +120,7 @@ class DownloadProgress:
 
 def get_saved_tracks() -> list:
     """ Returns user's saved tracks """
-    songs = []
-    offset = 0
-    limit = 50
-
-    while True:
-        resp = Zotify.invoke_url_with_params(
-            SAVED_TRACKS_URL, limit=limit, offset=offset)
-        offset += limit
-        songs.extend(resp[ITEMS])
-        if len(resp[ITEMS]) < limit:
-            break
-
-    return songs
+    return Zotify.invoke_url_paginated(SAVED_TRACKS_URL, limit=50)
 
 
 def get_followed_artists() -> list:
@@ -76,6 +133,30 @@ def get_followed_artists() -> list:
     return artists
 
 
+def parse_song_info(track: dict) -> Tuple[List[str], List[Any], str, str, Any, Any, Any, Any, Any, Any, int]:
+    """ Extracts the metadata used for downloading from a TRACKS_URL track object """
+    artists = []
+    for data in track[ARTISTS]:
+        artists.append(data[NAME])
+
+    album_name = track[ALBUM][NAME]
+    name = track[NAME]
+    release_year = track[ALBUM][RELEASE_DATE].split('-')[0]
+    disc_number = track[DISC_NUMBER]
+    track_number = track[TRACK_NUMBER]
+    scraped_song_id = track[ID]
+    is_playable = track[IS_PLAYABLE]
+    duration_ms = track[DURATION_MS]
+
+    image = track[ALBUM][IMAGES][0]
+    for i in track[ALBUM][IMAGES]:
+        if i[WIDTH] > image[WIDTH]:
+            image = i
+    image_url = image[URL]
+
+    return artists, track[ARTISTS], album_name, name, image_url, release_year, disc_number, track_number, scraped_song_id, is_playable, duration_ms
+
+
 def get_song_info(song_id) -> Tuple[List[str], List[Any], str, str, Any, Any, Any, Any, Any, Any, int]:
     """ Retrieves metadata for downloaded songs """
     with Loader(PrintChannel.PROGRESS_INFO, "Fetching track information..."):
@@ -85,38 +166,65 @@ def get_song_info(song_id) -> Tuple[List[str], List[Any], str, str, Any, Any, An
         raise ValueError(f'Invalid response from TRACKS_URL:\n{raw}')
 
     try:
-        artists = []
-        for data in info[TRACKS][0][ARTISTS]:
-            artists.append(data[NAME])
-
-        album_name = info[TRACKS][0][ALBUM][NAME]
-        name = info[TRACKS][0][NAME]
-        release_year = info[TRACKS][0][ALBUM][RELEASE_DATE].split('-')[0]
-        disc_number = info[TRACKS][0][DISC_NUMBER]
-        track_number = info[TRACKS][0][TRACK_NUMBER]
-        scraped_song_id = info[TRACKS][0][ID]
-        is_playable = info[TRACKS][0][IS_PLAYABLE]
-        duration_ms = info[TRACKS][0][DURATION_MS]
-
-        image = info[TRACKS][0][ALBUM][IMAGES][0]
-        for i in info[TRACKS][0][ALBUM][IMAGES]:
-            if i[WIDTH] > image[WIDTH]:
-                image = i
-        image_url = image[URL]
-
-        return artists, info[TRACKS][0][ARTISTS], album_name, name, image_url, release_year, disc_number, track_number, scraped_song_id, is_playable, duration_ms
+        return parse_song_info(info[TRACKS][0])
     except Exception as e:
         raise ValueError(f'Failed to parse TRACKS_URL response: {str(e)}\n{raw}')
 
 
-def get_song_genres(rawartists: List[str], track_name: str) -> List[str]:
+def prefetch_song_info(track_ids: List[str]) -> dict:
+    """ Retrieves metadata for many songs at once, API_BATCH_SIZE ids per request """
+    song_infos = {}
+    track_ids = list(dict.fromkeys(track_id for track_id in track_ids if track_id))
+    if not track_ids:
+        return song_infos
+
+    with Loader(PrintChannel.PROGRESS_INFO, f"Fetching track information for {len(track_ids)} tracks..."):
+        batches = [track_ids[i:i + API_BATCH_SIZE] for i in range(0, len(track_ids), API_BATCH_SIZE)]
+        responses = Zotify.invoke_urls([f'{TRACKS_URL}?ids={",".join(batch)}&market=from_token' for batch in batches])
+        for batch, (raw, info) in zip(batches, responses):
+            if TRACKS not in info:
+                # download_track falls back to fetching these one by one
+                continue
+            # the endpoint answers in request order, with null for unknown ids
+            for track_id, track in zip(batch, info[TRACKS]):
+                if not track:
+                    continue
+                try:
+                    song_infos[track_id] = parse_song_info(track)
+                except Exception:
+                    continue
+
+        if Zotify.CONFIG.get_save_genres():
+            prefetch_artist_info([artist[ID] for song_info in song_infos.values() for artist in song_info[1]])
+
+    return song_infos
+
+
+def prefetch_artist_info(artist_ids: List[str]) -> None:
+    """ Retrieves artists into ARTIST_INFO_CACHE, API_BATCH_SIZE ids per request """
+    artist_ids = [artist_id for artist_id in dict.fromkeys(artist_ids) if artist_id and artist_id not in ARTIST_INFO_CACHE]
+    batches = [artist_ids[i:i + API_BATCH_SIZE] for i in range(0, len(artist_ids), API_BATCH_SIZE)]
+    for (raw, info) in Zotify.invoke_urls([f'{ARTISTS_URL}?ids={",".join(batch)}' for batch in batches]):
+        if ARTISTS not in info:
+            continue
+        for artist in info[ARTISTS]:
+            if artist:
+                ARTIST_INFO_CACHE[artist[ID]] = artist
+
+
+def get_song_genres(rawartists: List[Any], track_name: str) -> List[str]:
     if Zotify.CONFIG.get_save_genres():
         try:
+            missing = [data[ID] for data in rawartists if data[ID] not in ARTIST_INFO_CACHE]
+            if missing:
+                with Loader(PrintChannel.PROGRESS_INFO, "Fetching artist information..."):
+                    prefetch_artist_info(missing)
+
             genres = []
             for data in rawartists:
-                # query artist genres via href, which will be the api url
-                with Loader(PrintChannel.PROGRESS_INFO, "Fetching artist information..."):
-                    (raw, artistInfo) = Zotify.invoke_url(f'{data[HREF]}')
+                artistInfo = ARTIST_INFO_CACHE.get(data[ID])
+                if artistInfo is None:
+                    continue
                 if Zotify.CONFIG.get_all_genres() and len(artistInfo[GENRES]) > 0:
                     for genre in artistInfo[GENRES]:
                         genres.append(genre)
@@ -129,7 +237,7 @@ def get_song_genres(rawartists: List[str], track_name: str) -> List[str]:
 
             return genres
         except Exception as e:
-            raise ValueError(f'Failed to parse GENRES response: {str(e)}\n{raw}')
+            raise ValueError(f'Failed to parse GENRES response: {str(e)}')
     else:
         return ['']
 
@@ -172,181 +280,293 @@ def get_song_duration(song_id: str) -> float:
     return duration
 
 
-def download_track(mode: str, track_id: str, extra_keys=None, disable_progressbar=False) -> None:
-    """ Downloads raw song audio from Spotify """
-
-    if extra_keys is None:
-        extra_keys = {}
-
-    prepare_download_loader = Loader(PrintChannel.PROGRESS_INFO, "Preparing download...")
-    prepare_download_loader.start()
-
-    try:
-        (artists, raw_artists, album_name, name, image_url, release_year, disc_number,
-         track_number, scraped_song_id, is_playable, duration_ms) = get_song_info(track_id)
-
-        song_name = sanitize_data(artists[0]) + ' - ' + sanitize_data(name)
+# the stages a TrackDownload passes, in order
+TRACK_STAGES = ['prepare', 'download', 'convert', 'postprocess']
 
-        filename = get_file_path(artists[0], album_name, name, track_number, extra_keys.get('playlist_name'), mode == 'playlist', mode == 'single')
-        filedir = PurePath(filename).parent
 
-        filename_temp = filename
-        if Zotify.CONFIG.get_temp_download_dir() != '':
-            filename_temp = PurePath(Zotify.CONFIG.get_temp_download_dir()).joinpath(f'zotify_{str(uuid.uuid4())}_{track_id}.{Path(filename).suffix}')
+class TrackDownload:
+    """ A single track on its way through TRACK_STAGES, each stage returns whether the track goes on """
 
-        check_name = Path(filename).is_file() and Path(filename).stat().st_size
-        check_id = scraped_song_id in get_directory_song_ids(filedir)
-        check_all_time = scraped_song_id in get_previously_downloaded()
+    def __init__(self, mode: str, track_id: str, extra_keys=None, disable_progressbar=False, song_info=None):
+        self.mode = mode
+        self.track_id = track_id
+        # download switches track_id to the id a relinked track is served under
+        self.requested_track_id = track_id
+        self.extra_keys = extra_keys if extra_keys is not None else {}
+        self.disable_progressbar = disable_progressbar
+        self.song_info = song_info
+        self.song_name = None
+        self.filename_temp = None
+        self.leased_temp = None
+        # only a partial file under the name derived from the track is found again by a later run
+        self.resumable = True
+        self.partial = None
+        # set once the audio was converted while it streamed, the convert stage has nothing left to do then
+        self.transcoded = False
+        self.prepare_download_loader = Loader(PrintChannel.PROGRESS_INFO, "Preparing download...")
 
-        # a song with the same name is installed
-        if not check_id and check_name:
-            c = len([file for file in Path(filedir).iterdir() if re.search(f'^{filename}_', str(file))]) + 1
-
-            fname = PurePath(PurePath(filename).name).parent
-            ext = PurePath(PurePath(filename).name).suffix
-
-            filename = PurePath(filedir).joinpath(f'{fname}_{c}{ext}')
-
-        # Initialize download_progress if it doesn't exist
-        if Printer.download_progress is None:
-            total_tracks = int(extra_keys.get('total_tracks', 1))
-            Printer.init_download_progress(total_tracks)
-
-    except Exception as e:
-        console.print(Panel(f"[red]Error: Skipping song - Failed to query metadata[/red]"))
-        console.print(f"[red]Track ID: {track_id}[/red]")
-        for k in extra_keys:
-            console.print(f"[red]{k}: {extra_keys[k]}[/red]")
-        console.print("\n")
-        console.print(f"[red]{str(e)}[/red]\n")
-        console.print(Text("".join(traceback.TracebackException.from_exception(e).format()), style="red"))
-        Printer.update_download_progress('failed')
+    def prepare(self) -> bool:
+        """ Resolves metadata and file paths, returns False if the track is skipped """
+        self.prepare_download_loader.start()
 
-    else:
         try:
-            if not is_playable:
-                prepare_download_loader.stop()
-                console.print(Panel(f"[yellow]Skipping: {song_name} (Song is unavailable)[/yellow]"))
-                Printer.update_download_progress('skipped')
-            else:
-                sync_lyrics_only = Zotify.CONFIG.get_sync_lyrics_only_mode()
-                if check_id and check_name and (Zotify.CONFIG.get_skip_existing() or sync_lyrics_only):
-                    if sync_lyrics_only and Zotify.CONFIG.get_download_lyrics():
-                        lyrics_filename = PurePath(str(filename)[:-3] + "lrc")
-                        if Path(lyrics_filename).is_file():
-                            console.print(Text(f"Lyrics already exist for {name}", style="cyan"))
-                            Printer.update_download_progress('skipped')
-                        else:
-                            try:
-                                get_song_lyrics(track_id, lyrics_filename)
-                                console.print(Text(f"Lyrics downloaded for {name}", style="green"))
-                                Printer.update_download_progress('downloaded')
-                            except ValueError:
-                                console.print(Text(f"Lyrics not available for {name}", style="yellow"))
-                                Printer.update_download_progress('skipped')
-                    else:
-                        prepare_download_loader.stop()
-                        console.print(Panel(f"[yellow]Skipping: {song_name} (Song already exists)[/yellow]"))
-                        Printer.update_download_progress('skipped')
-
-                elif check_all_time and Zotify.CONFIG.get_skip_previously_downloaded():
-                    prepare_download_loader.stop()
-                    console.print(Panel(f"[yellow]Skipping: {song_name} (Song already downloaded once)[/yellow]"))
-                    Printer.update_download_progress('skipped')
-
-                else:
-                    if track_id != scraped_song_id:
-                        track_id = scraped_song_id
-                    track = TrackId.from_base62(track_id)
-                    stream = Zotify.get_content_stream(track, Zotify.DOWNLOAD_QUALITY)
-                    create_download_directory(filedir)
-                    total_size = stream.input_stream.size
-
-                    prepare_download_loader.stop()
-
-                    time_start = time.time()
-                    downloaded = 0
-                    with open(filename_temp, 'wb') as file, Printer.progress(
-                            desc=song_name,
-                            total=total_size,
-                            unit='B',
-                            unit_scale=True,
-                            unit_divisor=1024,
-                            disable=disable_progressbar
-                    ) as p_bar:
-                        b = 0
-                        while b < 5:
-                            data = stream.input_stream.stream().read(Zotify.CONFIG.get_chunk_size())
-                            p_bar.update(file.write(data))
-                            downloaded += len(data)
-                            b += 1 if data == b'' else 0
-                            if Zotify.CONFIG.get_download_real_time():
-                                delta_real = time.time() - time_start
-                                delta_want = (downloaded / total_size) * (duration_ms/1000)
-                                if delta_want > delta_real:
-                                    time.sleep(delta_want - delta_real)
-
-                    time_downloaded = time.time()
-
-                    genres = get_song_genres(raw_artists, name)
-
-                    if(Zotify.CONFIG.get_download_lyrics()):
-                        lyrics_filename = PurePath(str(filename)[:-3] + "lrc")
-                        if Path(lyrics_filename).is_file():
-                            console.print(Text(f"Lyrics already exist for {name}", style="cyan"))
-                        else:
-                            try:
-                                get_song_lyrics(track_id, lyrics_filename)
-                                console.print(Text(f"Lyrics downloaded for {name}", style="green"))
-                            except ValueError:
-                                console.print(Text(f"Lyrics not available for {name}", style="yellow"))
-                    convert_audio_format(filename_temp)
-                    try:
-                        main_artist, title_with_featured = conv_artist_format(artists, name)
-                        set_audio_tags(filename_temp, artists, title_with_featured, album_name, release_year, disc_number, track_number, main_artist)
-                        set_music_thumbnail(PurePath(filename_temp).parent, image_url)
-                    except Exception:
-                        console.print(Text("Unable to write metadata, ensure ffmpeg is installed and added to your PATH.", style="red"))
-
-                    if filename_temp != filename:
-                        Path(filename_temp).rename(filename)
+            (self.artists, self.raw_artists, self.album_name, self.name, self.image_url, self.release_year, self.disc_number,
+             self.track_number, self.scraped_song_id, self.is_playable, self.duration_ms) = self.song_info if self.song_info else get_song_info(self.track_id)
+
+            self.song_name = sanitize_data(self.artists[0]) + ' - ' + sanitize_data(self.name)
+
+            filename = get_file_path(self.artists[0], self.album_name, self.name, self.track_number, self.extra_keys.get('playlist_name'), self.mode == 'playlist', self.mode == 'single')
+            self.filedir = PurePath(filename).parent
+
+            self.filename_temp = filename
+            if Zotify.CONFIG.get_temp_download_dir() != '':
+                # named after the track so an interrupted download is found again by the next run
+                self.filename_temp = PurePath(Zotify.CONFIG.get_temp_download_dir()).joinpath(f'zotify_{self.track_id}{Path(filename).suffix}')
+            if not PartialDownload.lease(self.filename_temp):
+                # the same track is already being downloaded to this path by another job, this copy gets
+                # a scratch name of its own and can not be resumed
+                temp_path = PurePath(self.filename_temp)
+                self.filename_temp = temp_path.with_name(f'{temp_path.stem}.{uuid.uuid4().hex[:8]}{temp_path.suffix}')
+                self.resumable = False
+                PartialDownload.lease(self.filename_temp)
+            self.leased_temp = self.filename_temp
+
+            self.check_name = Path(filename).is_file() and Path(filename).stat().st_size
+            self.check_id = self.scraped_song_id in get_directory_song_ids(self.filedir)
+            self.check_all_time = (Zotify.CONFIG.get_skip_previously_downloaded()
+                                   and self.scraped_song_id in get_previously_downloaded())
+
+            # a song with the same name is installed
+            if not self.check_id and self.check_name:
+                c = len([file for file in Path(self.filedir).iterdir() if re.search(f'^{filename}_', str(file))]) + 1
+
+                fname = PurePath(PurePath(filename).name).parent
+                ext = PurePath(PurePath(filename).name).suffix
+
+                filename = PurePath(self.filedir).joinpath(f'{fname}_{c}{ext}')
+            self.filename = filename
+
+            # Initialize download_progress if it doesn't exist
+            if Printer.download_progress is None:
+                total_tracks = int(self.extra_keys.get('total_tracks', 1))
+                Printer.init_download_progress(total_tracks)
 
-                    time_finished = time.time()
-
-                    console.print(Panel(f"[green]Downloaded:[/green] {song_name}\n[blue]To:[/blue] {Path(filename).relative_to(Zotify.CONFIG.get_root_path())}\n[cyan]Time:[/cyan] {fmt_seconds(time_downloaded - time_start)} (plus {fmt_seconds(time_finished - time_downloaded)} converting)"))
-                    Printer.print_track_info(track_number, Printer.download_progress.total_tracks, name, artists[0], f"{total_size / 1024 / 1024:.2f}MB", Zotify.DOWNLOAD_QUALITY)
-
-                    # add song id to archive file
-                    if Zotify.CONFIG.get_skip_previously_downloaded():
-                        add_to_archive(scraped_song_id, PurePath(filename).name, artists[0], name)
-                    # add song id to download directory's .song_ids file
-                    if not check_id:
-                        add_to_directory_song_ids(filedir, scraped_song_id, PurePath(filename).name, artists[0], name)
-
-                    Printer.update_download_progress('downloaded')
-
-                    if Zotify.CONFIG.get_bulk_wait_time():
-                        time.sleep(Zotify.CONFIG.get_bulk_wait_time() + 5)
         except Exception as e:
-            console.print(Panel(f"[red]Error: Skipping {song_name} (General download error)[/red]"))
-            console.print(f"[red]Track ID: {track_id}[/red]")
-            for k in extra_keys:
-                console.print(f"[red]{k}: {extra_keys[k]}[/red]")
+            console.print(Panel(f"[red]Error: Skipping song - Failed to query metadata[/red]"))
+            console.print(f"[red]Track ID: {self.track_id}[/red]")
+            for k in self.extra_keys:
+                console.print(f"[red]{k}: {self.extra_keys[k]}[/red]")
             console.print("\n")
             console.print(f"[red]{str(e)}[/red]\n")
             console.print(Text("".join(traceback.TracebackException.from_exception(e).format()), style="red"))
-            if Path(filename_temp).exists():
-                Path(filename_temp).unlink()
+            report_track_failure(self.requested_track_id)
             Printer.update_download_progress('failed')
+            return False
+
+        if not self.is_playable:
+            self.prepare_download_loader.stop()
+            console.print(Panel(f"[yellow]Skipping: {self.song_name} (Song is unavailable)[/yellow]"))
+            Printer.update_download_progress('skipped')
+            return False
+
+        sync_lyrics_only = Zotify.CONFIG.get_sync_lyrics_only_mode()
+        if self.check_id and self.check_name and (Zotify.CONFIG.get_skip_existing() or sync_lyrics_only):
+            if sync_lyrics_only and Zotify.CONFIG.get_download_lyrics():
+                lyrics_filename = PurePath(str(self.filename)[:-3] + "lrc")
+                if Path(lyrics_filename).is_file():
+                    console.print(Text(f"Lyrics already exist for {self.name}", style="cyan"))
+                    Printer.update_download_progress('skipped')
+                else:
+                    try:
+                        get_song_lyrics(self.track_id, lyrics_filename)
+                        console.print(Text(f"Lyrics downloaded for {self.name}", style="green"))
+                        Printer.update_download_progress('downloaded')
+                    except ValueError:
+                        console.print(Text(f"Lyrics not available for {self.name}", style="yellow"))
+                        Printer.update_download_progress('skipped')
+            else:
+                self.prepare_download_loader.stop()
+                console.print(Panel(f"[yellow]Skipping: {self.song_name} (Song already exists)[/yellow]"))
+                Printer.update_download_progress('skipped')
+            return False
+
+        if self.check_all_time and Zotify.CONFIG.get_skip_previously_downloaded():
+            self.prepare_download_loader.stop()
+            console.print(Panel(f"[yellow]Skipping: {self.song_name} (Song already downloaded once)[/yellow]"))
+            Printer.update_download_progress('skipped')
+            return False
+
+        return True
+
+    def download(self) -> bool:
+        """ Streams the raw audio into filename_temp, or through ffmpeg with STREAM_TRANSCODE, reopening a stalled
+            stream up to STREAM_RETRIES times """
+        if self.track_id != self.scraped_song_id:
+            self.track_id = self.scraped_song_id
+        create_download_directory(self.filedir)
+        # Ogg Vorbis output keeps the downloaded stream as it is, there is nothing to pipe through ffmpeg
+        transcode = Zotify.CONFIG.get_stream_transcode() and get_output_params()[1] != 'copy'
+        retries = Zotify.CONFIG.get_stream_retries()
+        for attempt in range(retries + 1):
+            try:
+                if transcode:
+                    self.stream_audio_transcoded()
+                else:
+                    self.stream_audio()
+                break
+            except FFmpegNotFoundError:
+                # the convert stage reports the missing ffmpeg and keeps the raw audio
+                transcode = False
+                self.stream_audio()
+                break
+            except StreamStalledError as e:
+                if attempt == retries:
+                    raise
+                # the partial file keeps what arrived, the new stream continues from there
+                Printer.print(PrintChannel.WARNINGS, f'###   {self.song_name}: {e}, reopening the stream '
+                                                     f'({attempt + 1}/{retries})   ###')
+
+        if not self.transcoded:
+            self.partial.commit(self.filename_temp)
+        self.time_downloaded = time.time()
+        return True
+
+    def open_stream(self):
+        """ Opens the content stream, returns it with the position its audio starts at """
+        track = TrackId.from_base62(self.track_id)
+        stream = Zotify.get_content_stream(track, Zotify.DOWNLOAD_QUALITY)
+        self.total_size = stream.input_stream.size
+        # the stream starts behind the Spotify header, which is not part of the file
+        return stream, stream.input_stream.stream().pos()
+
+    def pump_stream(self, stream, write, start: int, offset: int) -> None:
+        """ Copies the stream from start + offset to its end into write, with a progress bar """
+        total_size = self.total_size
+        self.prepare_download_loader.stop()
+
+        self.time_start = time.time()
+
+        # DOWNLOAD_REAL_TIME caps the stream at the rate it would be played at
+        real_time_rate = total_size / (self.duration_ms / 1000) if Zotify.CONFIG.get_download_real_time() else None
+        with HttpClient.get_bandwidth_limiter().open(real_time_rate) as share, Printer.progress(
+                desc=self.song_name,
+                total=total_size,
+                unit='B',
+                unit_scale=True,
+                unit_divisor=1024,
+                disable=self.disable_progressbar
+        ) as p_bar:
+            p_bar.update(start + offset)
+            pump = StreamPump(write, Zotify.CONFIG.get_chunk_size(), on_progress=Printer.bandwidth_progress(p_bar),
+                              throttle=share.throttle,
+                              stall_timeout=Zotify.CONFIG.get_stream_stall_timeout(),
+                              min_throughput=Zotify.CONFIG.get_min_stream_throughput())
+            try:
+                copied = pump.copy(read=stream.input_stream.stream().read, limit=total_size - start - offset,
+                                   position=start + offset)
+            finally:
+                if pump.aborted:
+                    # releases the reader thread, which is still waiting for a chunk that is not coming
+                    close_content_stream(stream.input_stream.stream())
+        if copied != total_size - start - offset:
+            raise IOError(f'Download incomplete, got {start + offset + copied} of {total_size} bytes')
+
+    def stream_audio(self) -> None:
+        stream, start = self.open_stream()
+        self.partial = PartialDownload(self.filename_temp, self.scraped_song_id, stream.metrics.file_id)
+        offset = self.partial.load(self.total_size - start)
+        if offset:
+            stream.input_stream.stream().seek(start + offset)
+        with self.partial.open(self.total_size - start, offset):
+            self.pump_stream(stream, self.partial.write, start, offset)
+
+    def stream_audio_transcoded(self) -> None:
+        # ffmpeg output can not be continued, so this always starts from the beginning of the track
+        stream, start = self.open_stream()
+        with FFmpegPipe(self.filename_temp, get_output_params()) as ffmpeg:
+            self.pump_stream(stream, ffmpeg.write, start, 0)
+            ffmpeg.finish()
+        self.transcoded = True
+
+    def convert(self) -> bool:
+        """ Converts filename_temp into DOWNLOAD_FORMAT on the shared Transcoder """
+        if not self.transcoded:
+            convert_audio_format(self.filename_temp)
+        return True
+
+    def postprocess(self) -> bool:
+        """ Fetches lyrics and tags the file, then moves it into place and archives it """
+        genres = get_song_genres(self.raw_artists, self.name)
+
+        if(Zotify.CONFIG.get_download_lyrics()):
+            lyrics_filename = PurePath(str(self.filename)[:-3] + "lrc")
+            if Path(lyrics_filename).is_file():
+                console.print(Text(f"Lyrics already exist for {self.name}", style="cyan"))
+            else:
+                try:
+                    get_song_lyrics(self.track_id, lyrics_filename)
+                    console.print(Text(f"Lyrics downloaded for {self.name}", style="green"))
+                except ValueError:
+                    console.print(Text(f"Lyrics not available for {self.name}", style="yellow"))
+        try:
+            main_artist, title_with_featured = conv_artist_format(self.artists, self.name)
+            # the cover of this very track is embedded, the folder.jpg of a shared temp directory may be another album's
+            cover = get_cover_art(self.image_url)
+            set_music_thumbnail(PurePath(self.filename_temp).parent, self.image_url, cover)
+            set_audio_tags(self.filename_temp, self.artists, title_with_featured, self.album_name, self.release_year, self.disc_number, self.track_number, main_artist, cover)
+        except Exception:
+            console.print(Text("Unable to write metadata, ensure ffmpeg is installed and added to your PATH.", style="red"))
+
+        if self.filename_temp != self.filename:
+            Path(self.filename_temp).rename(self.filename)
+
+        time_finished = time.time()
+
+        console.print(Panel(f"[green]Downloaded:[/green] {self.song_name}\n[blue]To:[/blue] {Path(self.filename).relative_to(Zotify.CONFIG.get_root_path())}\n[cyan]Time:[/cyan] {fmt_seconds(self.time_downloaded - self.time_start)} (plus {fmt_seconds(time_finished - self.time_downloaded)} converting)"))
+        Printer.print_track_info(self.track_number, Printer.download_progress.total_tracks, self.name, self.artists[0], f"{self.total_size / 1024 / 1024:.2f}MB", Zotify.DOWNLOAD_QUALITY)
+
+        # add song id to archive file
+        if Zotify.CONFIG.get_skip_previously_downloaded():
+            add_to_archive(self.scraped_song_id, PurePath(self.filename).name, self.artists[0], self.name)
+        # add song id to download directory's .song_ids file
+        if not self.check_id:
+            add_to_directory_song_ids(self.filedir, self.scraped_song_id, PurePath(self.filename).name, self.artists[0], self.name)
+
+        Printer.update_download_progress('downloaded')
+        return True
+
+    def fail(self, e: Exception) -> None:
+        console.print(Panel(f"[red]Error: Skipping {self.song_name} (General download error)[/red]"))
+        console.print(f"[red]Track ID: {self.track_id}[/red]")
+        for k in self.extra_keys:
+            console.print(f"[red]{k}: {self.extra_keys[k]}[/red]")
+        console.print("\n")
+        console.print(f"[red]{str(e)}[/red]\n")
+        console.print(Text("".join(traceback.TracebackException.from_exception(e).format()), style="red"))
+        if self.filename_temp and Path(self.filename_temp).exists():
+            Path(self.filename_temp).unlink()
+        if self.filename_temp and not self.resumable:
+            PartialDownload.discard(self.filename_temp)
+        report_track_failure(self.requested_track_id, self.track_id)
+        Printer.update_download_progress('failed')
 
-    prepare_download_loader.stop()
+    def finish(self) -> None:
+        self.prepare_download_loader.stop()
+        if self.leased_temp:
+            if not self.resumable:
+                # a one-off name is never picked up again
+                PartialDownload.discard(self.leased_temp)
+            PartialDownload.release(self.leased_temp)
+            self.leased_temp = None
 
 
-def convert_audio_format(filename) -> None:
-    """ Converts raw audio into playable file """
-    temp_filename = f'{PurePath(filename).parent}.tmp'
-    Path(filename).replace(temp_filename)
+def download_track(mode: str, track_id: str, extra_keys=None, disable_progressbar=False, song_info=None) -> None:
+    """ Downloads raw song audio from Spotify, song_info may hold metadata from prefetch_song_info """
+    run_stages(TrackDownload(mode, track_id, extra_keys, disable_progressbar, song_info), TRACK_STAGES)
 
+
+def get_output_params() -> List[str]:
+    """ Returns the ffmpeg output options for DOWNLOAD_FORMAT """
     download_format = Zotify.CONFIG.get_download_format().lower()
     file_codec = CODEC_MAP.get(download_format, 'copy')
     if file_codec != 'copy':
@@ -364,18 +584,33 @@ def convert_audio_format(filename) -> None:
     output_params = ['-c:a', file_codec]
     if bitrate:
         output_params += ['-b:a', bitrate]
+    return output_params
+
+
+def convert_audio_format(filename) -> None:
+    """ Converts raw audio into playable file """
+    output_params = get_output_params()
+    file_codec = output_params[1]
+    if file_codec == 'copy' and is_ogg_vorbis(filename):
+        # Spotify already serves Ogg Vorbis, remuxing it in ffmpeg would only copy the file
+        return
+
+    # unique scratch file per track, several workers may convert into the same directory
+    temp_filename = f'{filename}.{uuid.uuid4().hex[:8]}.tmp'
+    Path(filename).replace(temp_filename)
 
     try:
-        ff_m = ffmpy.FFmpeg(
-            global_options=['-y', '-hide_banner', '-loglevel error'],
-            inputs={temp_filename: None},
-            outputs={filename: output_params}
-        )
         with Loader(PrintChannel.PROGRESS_INFO, "Converting file..."):
-            ff_m.run()
+            Transcoder.convert(temp_filename, filename, output_params)
 
         if Path(temp_filename).exists():
             Path(temp_filename).unlink()
 
-    except ffmpy.FFExecutableNotFoundError:
-        console.print(Text(f"[yellow]SKIPPING {file_codec.upper()} CONVERSION - FFMPEG NOT FOUND[/yellow]"))
+    except FFmpegNotFoundError:
+        # keep the raw download under its final name
+        Path(temp_filename).replace(filename)
+        console.print(Text(f"SKIPPING {file_codec.upper()} CONVERSION - FFMPEG NOT FOUND", style="yellow"))
+    except Exception:
+        if Path(temp_filename).exists():
+            Path(temp_filename).unlink()
+        raise
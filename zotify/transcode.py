@@ -0,0 +1,152 @@
+import os
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+class FFmpegNotFoundError(Exception):
+    pass
+
+
+def get_available_cores() -> int:
+    """ Returns the number of cores this process may run on """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def start_ffmpeg(args: List[str], stdin=subprocess.DEVNULL) -> subprocess.Popen:
+    try:
+        return subprocess.Popen(['ffmpeg'] + args, stdin=stdin, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise FFmpegNotFoundError('ffmpeg was not found, ensure it is installed and added to your PATH')
+
+
+def wait_ffmpeg(process: subprocess.Popen, stderr: bytes) -> Optional[float]:
+    """ Waits for ffmpeg to exit, returns its CPU time where the platform reports it """
+    cpu_time = None
+    if hasattr(os, 'wait4'):
+        # reaps the process ourselves to get the resources it used on its own
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        cpu_time = usage.ru_utime + usage.ru_stime
+    else:
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f'ffmpeg exited with status {process.returncode}: {stderr.decode("utf-8", "replace").strip()}')
+    return cpu_time
+
+
+def run_ffmpeg(args: List[str]) -> Tuple[float, Optional[float]]:
+    """ Runs ffmpeg with args, returns its wall time and, where the platform reports it, its CPU time """
+    time_start = time.monotonic()
+    process = start_ffmpeg(args)
+    with process:
+        stderr = process.stderr.read()
+        cpu_time = wait_ffmpeg(process, stderr)
+    return time.monotonic() - time_start, cpu_time
+
+
+class FFmpegPipe:
+    """ ffmpeg converting whatever is written to it into output_path while the audio is still downloading.
+        The output goes to a hidden scratch file that only replaces output_path once ffmpeg succeeded """
+
+    def __init__(self, output_path, output_params: List[str]):
+        self.output_path = Path(output_path)
+        # keeps the extension, ffmpeg picks the container from it
+        self.scratch_path = self.output_path.with_name(f'.{uuid.uuid4().hex[:8]}.{self.output_path.name}')
+        self.args = ['-y', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0'] + output_params + [str(self.scratch_path)]
+        self.process = None
+        self.stderr = b''
+        self.stderr_reader = None
+        self.time_start = None
+
+    def _read_stderr(self) -> None:
+        # drained on the side, a full stderr pipe would block ffmpeg and with it our writes
+        self.stderr = self.process.stderr.read()
+
+    def write(self, data) -> int:
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            self.stderr_reader.join()
+            raise RuntimeError(f'ffmpeg stopped reading: {self.stderr.decode("utf-8", "replace").strip()}')
+        return len(data)
+
+    def _close_input(self) -> None:
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg already exited, wait_ffmpeg reports why
+            pass
+
+    def finish(self) -> None:
+        """ Ends the input, waits for ffmpeg and moves its output into place """
+        self._close_input()
+        self.stderr_reader.join()
+        cpu_time = wait_ffmpeg(self.process, self.stderr)
+        self.scratch_path.replace(self.output_path)
+
+        # we need to import that here, otherwise we will get circular imports!
+        from zotify.termoutput import Printer, PrintChannel
+        Printer.print(PrintChannel.DEBUG, f'ffmpeg {self.output_path.name}: {time.monotonic() - self.time_start:.2f}s '
+                      f'wall while streaming' + (f', {cpu_time:.2f}s CPU' if cpu_time is not None else ''))
+
+    def __enter__(self):
+        self.time_start = time.monotonic()
+        self.process = start_ffmpeg(self.args, stdin=subprocess.PIPE)
+        self.stderr_reader = threading.Thread(target=self._read_stderr, name='zotify-ffmpeg-stderr', daemon=True)
+        self.stderr_reader.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self.process.returncode is None:
+            self.process.kill()
+            self.process.wait()
+        self._close_input()
+        self.stderr_reader.join()
+        self.process.stderr.close()
+        self.scratch_path.unlink(missing_ok=True)
+
+
+class Transcoder:
+    """ Shared pool that runs one ffmpeg process per available core, whichever download thread asks for it """
+    EXECUTOR: ThreadPoolExecutor = None
+    # conversions submitted but not finished yet, including the running ones
+    pending = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        if cls.EXECUTOR is None:
+            with cls._lock:
+                if cls.EXECUTOR is None:
+                    # we need to import that here, otherwise we will get circular imports!
+                    from zotify.zotify import Zotify
+                    cls.EXECUTOR = ThreadPoolExecutor(Zotify.CONFIG.get_transcode_workers(), thread_name_prefix='zotify-ffmpeg')
+        return cls.EXECUTOR
+
+    @classmethod
+    def convert(cls, input_path: str, output_path: str, output_params: List[str]) -> None:
+        """ Converts input_path into output_path and blocks until ffmpeg is done """
+        args = ['-y', '-hide_banner', '-loglevel', 'error', '-i', str(input_path)] + output_params + [str(output_path)]
+        with cls._lock:
+            cls.pending += 1
+            queued = cls.pending
+        time_queued = time.monotonic()
+        try:
+            wall_time, cpu_time = cls.get_executor().submit(run_ffmpeg, args).result()
+        finally:
+            with cls._lock:
+                cls.pending -= 1
+
+        # we need to import that here, otherwise we will get circular imports!
+        from zotify.termoutput import Printer, PrintChannel
+        waited = time.monotonic() - time_queued - wall_time
+        Printer.print(PrintChannel.DEBUG, f'ffmpeg {os.path.basename(str(output_path))}: {wall_time:.2f}s wall'
+                      + (f', {cpu_time:.2f}s CPU' if cpu_time is not None else '')
+                      + f', {waited:.2f}s waiting for a core ({queued - 1} other conversions pending)')
@@ -1,21 +1,28 @@
 import datetime
+import json
 import math
 import os
 import platform
 import re
 import subprocess
+import threading
 from enum import Enum
 from pathlib import Path, PurePath
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import music_tag
-import requests
 
 from zotify.const import ARTIST, GENRE, TRACKTITLE, ALBUM, YEAR, DISCNUMBER, TRACKNUMBER, ARTWORK, \
     WINDOWS_SYSTEM, ALBUMARTIST
+from zotify.archive import SongArchive
+from zotify.httpclient import HttpClient
 from zotify.zotify import Zotify
 
 
+# download workers append to the .song_ids files concurrently
+ARCHIVE_LOCK = threading.Lock()
+
+
 class MusicFormat(str, Enum):
     MP3 = 'mp3',
     OGG = 'ogg',
@@ -32,30 +39,37 @@ def create_download_directory(download_path: str) -> None:
             pass
 
 
-def get_previously_downloaded() -> List[str]:
-    """ Returns list of all time downloaded songs """
+def get_previously_downloaded() -> SongArchive:
+    """ Returns the ids of all time downloaded songs, loaded once per run """
 
-    ids = []
-    archive_path = Zotify.CONFIG.get_song_archive()
+    return SongArchive.get_archive()
 
-    if Path(archive_path).exists():
-        with open(archive_path, 'r', encoding='utf-8') as f:
-            ids = [line.strip().split('\t')[0] for line in f.readlines()]
 
-    return ids
+def add_to_archive(song_id: str, filename: str, author_name: str, song_name: str) -> None:
+    """ Adds song id to all time installed songs archive, committed together with the songs added around it """
 
+    SongArchive.get_archive().add(song_id, filename, author_name, song_name)
 
-def add_to_archive(song_id: str, filename: str, author_name: str, song_name: str) -> None:
-    """ Adds song id to all time installed songs archive """
 
-    archive_path = Zotify.CONFIG.get_song_archive()
+def get_playlist_snapshot(playlist_id: str) -> Tuple[Optional[str], List[str]]:
+    """ Returns the snapshot id and track ids a playlist had when it was last synced """
 
-    if Path(archive_path).exists():
-        with open(archive_path, 'a', encoding='utf-8') as file:
-            file.write(f'{song_id}\t{datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\t{author_name}\t{song_name}\t{filename}\n')
-    else:
-        with open(archive_path, 'w', encoding='utf-8') as file:
-            file.write(f'{song_id}\t{datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\t{author_name}\t{song_name}\t{filename}\n')
+    snapshot_path = PurePath(Zotify.CONFIG.get_playlist_snapshot_dir()).joinpath(f'{playlist_id}.json')
+    if not Path(snapshot_path).is_file():
+        return None, []
+    with open(snapshot_path, 'r', encoding='utf-8') as file:
+        snapshot = json.load(file)
+    return snapshot['snapshot_id'], snapshot['items']
+
+
+def save_playlist_snapshot(playlist_id: str, snapshot_id: str, track_ids: List[str]) -> None:
+    """ Remembers the snapshot id and track ids of a synced playlist """
+
+    snapshot_path = PurePath(Zotify.CONFIG.get_playlist_snapshot_dir()).joinpath(f'{playlist_id}.json')
+    temp_path = PurePath(f'{snapshot_path}.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump({'snapshot_id': snapshot_id, 'items': track_ids}, file)
+    Path(temp_path).replace(snapshot_path)
 
 
 def get_directory_song_ids(download_path: str) -> List[str]:
@@ -77,7 +91,7 @@ def add_to_directory_song_ids(download_path: str, song_id: str, filename: str, a
     hidden_file_path = PurePath(download_path).joinpath('.song_ids')
     # not checking if file exists because we need an exception
     # to be raised if something is wrong
-    with open(hidden_file_path, 'a', encoding='utf-8') as file:
+    with ARCHIVE_LOCK, open(hidden_file_path, 'a', encoding='utf-8') as file:
         file.write(f'{song_id}\t{datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\t{author_name}\t{song_name}\t{filename}\n')
 
 
@@ -147,7 +161,7 @@ def conv_artist_format(artists) -> str:
 
 def set_music_thumbnail(filename, image_url) -> None:
     """ Downloads cover artwork """
-    img = requests.get(image_url).content
+    img = HttpClient.get(image_url).content
     tags = music_tag.load_file(filename)
     tags[ARTWORK] = img
     tags.save()
@@ -0,0 +1,164 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from typing import Callable, List
+
+from zotify.pipeline import Pipeline, run_stages
+from zotify.scheduler import Scheduler
+from zotify.termoutput import Printer
+from zotify.track import download_track, TrackDownload, TRACK_STAGES
+from zotify.zotify import Zotify
+
+
+class RecordedJobs(list):
+    """ The (fn, args, kwargs) jobs of a recording, with the callbacks that have to wait until they ran """
+
+    def __init__(self):
+        super().__init__()
+        self.deferred: List[Callable[[], None]] = []
+
+    def run_deferred(self) -> None:
+        for fn in self.deferred:
+            fn()
+        self.deferred = []
+
+
+class DownloadPool:
+    """ Runs the downloads of one batch on the shared DOWNLOAD_WORKERS threads, or inline with a single worker.
+        Every batch waits for its own jobs when its with block ends """
+    EXECUTOR: ThreadPoolExecutor = None
+    PIPELINE: Pipeline = None
+    # keeps the backlog of submitted but not yet started jobs small and decides whose job starts next
+    SCHEDULER: Scheduler = None
+    _lock = threading.Lock()
+    # jobs submitted on a thread that is recording are collected instead of run, see recording()
+    _recording = threading.local()
+
+    def __init__(self):
+        self.workers = Zotify.CONFIG.get_download_workers()
+        self.container = Scheduler.current()
+        self.futures: List[Future] = []
+
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        if cls.EXECUTOR is None:
+            with cls._lock:
+                if cls.EXECUTOR is None:
+                    workers = Zotify.CONFIG.get_download_workers()
+                    cls.EXECUTOR = ThreadPoolExecutor(workers, thread_name_prefix='zotify-download',
+                                                      initializer=Printer.set_background_thread)
+        return cls.EXECUTOR
+
+    @classmethod
+    def get_pipeline(cls) -> Pipeline:
+        if cls.PIPELINE is None:
+            with cls._lock:
+                if cls.PIPELINE is None:
+                    workers = (Zotify.CONFIG.get_prepare_workers(), Zotify.CONFIG.get_download_workers(),
+                               Zotify.CONFIG.get_transcode_workers(), Zotify.CONFIG.get_postprocess_workers())
+                    cls.PIPELINE = Pipeline(list(zip(TRACK_STAGES, workers)), Zotify.CONFIG.get_pipeline_queue_size())
+        return cls.PIPELINE
+
+    @classmethod
+    def get_scheduler(cls) -> Scheduler:
+        if cls.SCHEDULER is None:
+            with cls._lock:
+                if cls.SCHEDULER is None:
+                    workers = Zotify.CONFIG.get_download_workers()
+                    if Zotify.CONFIG.get_download_pipeline():
+                        # as many jobs as the stages and the queues between them hold
+                        slots = (Zotify.CONFIG.get_prepare_workers() + workers + Zotify.CONFIG.get_transcode_workers()
+                                 + Zotify.CONFIG.get_postprocess_workers()
+                                 + Zotify.CONFIG.get_pipeline_queue_size() * len(TRACK_STAGES))
+                    else:
+                        slots = 1 if workers == 1 else workers * 2
+                    cls.SCHEDULER = Scheduler(slots, Zotify.CONFIG.get_scheduling_policy())
+        return cls.SCHEDULER
+
+    @classmethod
+    @contextmanager
+    def recording(cls):
+        """ Collects the jobs the calling thread submits as (fn, args, kwargs) instead of running them """
+        cls._recording.jobs = jobs = RecordedJobs()
+        try:
+            yield jobs
+        finally:
+            cls._recording.jobs = None
+
+    @classmethod
+    def is_recording(cls) -> bool:
+        return getattr(cls._recording, 'jobs', None) is not None
+
+    @classmethod
+    def defer(cls, fn: Callable[[], None]) -> bool:
+        """ Holds fn back until the jobs recorded so far ran, returns False if the calling thread is not recording """
+        if not cls.is_recording():
+            return False
+        cls._recording.jobs.deferred.append(fn)
+        return True
+
+    def _run(self, fn: Callable, *args, **kwargs):
+        with Scheduler.use(self.container):
+            return fn(*args, **kwargs)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if self.is_recording():
+            self._recording.jobs.append((fn, args, kwargs))
+            future = Future()
+            future.set_result(None)
+            return future
+        scheduler = self.get_scheduler()
+        scheduler.acquire(self.container)
+        if self.workers == 1:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            finally:
+                scheduler.release()
+            return future
+        future = self.get_executor().submit(self._run, fn, *args, **kwargs)
+        future.add_done_callback(lambda _: scheduler.release())
+        self.futures.append(future)
+        return future
+
+    def submit_track(self, *args, **kwargs) -> Future:
+        """ Takes the arguments of download_track, runs it through the staged pipeline with DOWNLOAD_PIPELINE """
+        if self.is_recording() or not Zotify.CONFIG.get_download_pipeline():
+            return self.submit(download_track, *args, **kwargs)
+        return self.submit_job(TrackDownload(*args, **kwargs))
+
+    def submit_job(self, job: TrackDownload) -> Future:
+        """ Runs the stages of a prepared track job, through the staged pipeline with DOWNLOAD_PIPELINE """
+        if not Zotify.CONFIG.get_download_pipeline():
+            return self.submit(run_stages, job, TRACK_STAGES)
+        scheduler = self.get_scheduler()
+        scheduler.acquire(self.container)
+        # the stage threads print on behalf of the container of the job
+        job.container = self.container
+        future = self.get_pipeline().submit(job)
+        future.add_done_callback(lambda _: scheduler.release())
+        self.futures.append(future)
+        return future
+
+    def wait(self) -> None:
+        """ Blocks until every job of this batch is done, re-raising the first error a job did not handle itself """
+        error = None
+        for future in self.futures:
+            try:
+                future.result()
+            except Exception as e:
+                error = error or e
+        self.futures = []
+        if error:
+            raise error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            # interrupted, drop what has not started yet and let the running downloads finish
+            for future in self.futures:
+                future.cancel()
+            self.futures = [future for future in self.futures if not future.cancelled()]
+        self.wait()
@@ -1,24 +1,64 @@
+import asyncio
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from pwinput import pwinput
 import time
-import requests
+import weakref
+from typing import Optional, Tuple
 from librespot.audio.decoders import VorbisOnlyAudioQuality
 from librespot.core import Session
 
-from zotify.const import TYPE, \
+from zotify.const import TYPE, ITEMS, TOTAL, \
     PREMIUM, USER_READ_EMAIL, OFFSET, LIMIT, \
     PLAYLIST_READ_PRIVATE, USER_LIBRARY_READ, USER_FOLLOW_READ
+from zotify.aioclient import AsyncHttpClient, httpx
+from zotify.auth import AccessToken
+from zotify.cache import MetadataCache, normalize_url
 from zotify.config import Config
+from zotify.httpclient import HttpClient
+from zotify.replay import Recorder, ReplayTransport
+from zotify.sessions import SessionPool
+
+OFFLINE_METADATA_ERROR = {"error": {"status": "offline", "message": "not available in the metadata cache"}}
 
 class Zotify:    
     SESSION: Session = None
     DOWNLOAD_QUALITY = None
     CONFIG: Config = Config()
+    METADATA_CACHE: MetadataCache = None
+    OFFLINE_METADATA = False
+    ACCESS_TOKEN: AccessToken = None
 
     def __init__(self, args):
         Zotify.CONFIG.load(args)
-        Zotify.login(args)
+        Zotify.OFFLINE_METADATA = getattr(args, 'offline_metadata', False)
+        if Zotify.CONFIG.get_metadata_cache() or Zotify.OFFLINE_METADATA:
+            Zotify.METADATA_CACHE = MetadataCache(Zotify.CONFIG.get_metadata_cache_location(),
+                                                  Zotify.CONFIG.get_metadata_cache_size())
+        if Zotify.CONFIG.get_api_record_dir():
+            HttpClient.RECORDER = Recorder(Zotify.CONFIG.get_api_record_dir())
+        if Zotify.CONFIG.get_api_replay_dir():
+            HttpClient.REPLAY = ReplayTransport(Zotify.CONFIG.get_api_replay_dir(),
+                                                Zotify.CONFIG.get_replay_latency(),
+                                                Zotify.CONFIG.get_replay_rate_limit_percent(),
+                                                Zotify.CONFIG.get_replay_error_percent(),
+                                                Zotify.CONFIG.get_replay_seed())
+        if Zotify.CONFIG.get_async_api() and httpx is None:
+            # we need to import that here, otherwise we will get circular imports!
+            from zotify.termoutput import Printer, PrintChannel
+            Printer.print(PrintChannel.WARNINGS, 'ASYNC_API needs httpx[http2], falling back to blocking requests')
+
+        # offline runs only re-tag and re-layout and replayed runs answer from fixtures,
+        # so neither of them touches the network
+        if HttpClient.REPLAY:
+            Zotify.ACCESS_TOKEN = AccessToken(lambda: ('replay', 3600))
+        elif not Zotify.OFFLINE_METADATA:
+            Zotify.login(args)
+            Zotify.ACCESS_TOKEN = AccessToken(Zotify.fetch_auth_token, Zotify.discard_auth_token)
+            cred_location = Config.get_credentials_location()
+            SessionPool.setup(Zotify.SESSION, cred_location if Path(cred_location).is_file() else None,
+                              Zotify.CONFIG.get_credentials_pool())
 
     @classmethod
     def login(cls, args):
@@ -50,13 +90,59 @@ class Zotify:
 
     @classmethod
     def get_content_stream(cls, content_id, quality):
-        return cls.SESSION.content_feeder().load(content_id, VorbisOnlyAudioQuality(quality), False, None)
+        if cls.SESSION is None:
+            raise RuntimeError('Audio can not be streamed while running with --offline-metadata')
+        limiter = HttpClient.get_rate_limiter()
+        # a session that fails hands the stream to the next one
+        for attempt in range(SessionPool.size()):
+            pooled = SessionPool.lease()
+            limiter.acquire(pooled.host)
+            try:
+                stream = pooled.session.content_feeder().load(content_id, VorbisOnlyAudioQuality(quality), False, None)
+            except Exception:
+                # librespot does not expose the status, treat any failure as a throttling hint
+                limiter.on_response(pooled.host, 503)
+                SessionPool.report(pooled, False)
+                SessionPool.release(pooled)
+                if attempt + 1 == SessionPool.size():
+                    raise
+                continue
+            limiter.on_response(pooled.host, 200)
+            SessionPool.report(pooled, True)
+            # the lease lasts until the stream is no longer referenced, which is when its download is over
+            weakref.finalize(stream, SessionPool.release, pooled)
+            return stream
 
     @classmethod
-    def __get_auth_token(cls):
-        return cls.SESSION.tokens().get_token(
+    def fetch_auth_token(cls) -> Tuple[str, float]:
+        """ Returns a bearer token from the session and its remaining lifetime in seconds """
+        token = cls.SESSION.tokens().get_token(
             USER_READ_EMAIL, PLAYLIST_READ_PRIVATE, USER_LIBRARY_READ, USER_FOLLOW_READ
-        ).access_token
+        )
+        # StoredToken.timestamp is in microseconds
+        return token.access_token, token.timestamp / 1000000 + token.expires_in - time.time()
+
+    @classmethod
+    def discard_auth_token(cls, access_token) -> None:
+        """ Makes the session hand out a new token instead of its cached one """
+        token = cls.SESSION.tokens().find_token_with_all_scopes(
+            [USER_READ_EMAIL, PLAYLIST_READ_PRIVATE, USER_LIBRARY_READ, USER_FOLLOW_READ]
+        )
+        if token is not None and token.access_token == access_token:
+            # librespot drops expired tokens on the next lookup and logs in again
+            token.expires_in = 0
+
+    @classmethod
+    def _is_unauthorized(cls, response, headers) -> bool:
+        """ Drops the token a 401 was answered to, telling whether the request is worth sending again """
+        if response.status_code != 401 or cls.ACCESS_TOKEN is None:
+            return False
+        cls.ACCESS_TOKEN.invalidate(headers.get('Authorization', '').removeprefix('Bearer '))
+        return True
+
+    @classmethod
+    def __get_auth_token(cls):
+        return cls.ACCESS_TOKEN.get()
 
     @classmethod
     def get_auth_header(cls):
@@ -77,35 +163,176 @@ class Zotify:
             'app-platform': 'WebPlayer'
         }, {LIMIT: limit, OFFSET: offset}
 
+    @classmethod
+    def _get_cached(cls, url, params, use_cache) -> Tuple[Optional[str], Optional[str]]:
+        """ Returns the cache key of a request and its cached body, if there is one """
+        # recorded runs have to see every request and replayed ones answer from their fixtures only,
+        # neither reads nor fills the cache
+        if not cls.METADATA_CACHE or not use_cache or HttpClient.RECORDER or HttpClient.REPLAY:
+            return None, None
+        cache_key = normalize_url(url, params, cls.CONFIG.get_language())
+        return cache_key, cls.METADATA_CACHE.get(cache_key, allow_expired=cls.OFFLINE_METADATA)
+
+    @classmethod
+    def _put_cached(cls, cache_key, url, response) -> None:
+        if cache_key and response.status_code == 200 and response.text:
+            cls.METADATA_CACHE.put(cache_key, url, response.text)
+
+    @classmethod
+    def fetch(cls, url, params=None, header_fn=None, use_cache=True) -> str:
+        """ Returns the body of an authenticated GET request, served from the metadata cache when possible """
+        if AsyncHttpClient.is_enabled():
+            return AsyncHttpClient.run(cls.fetch_async(url, params, header_fn, use_cache))
+
+        cache_key, body = cls._get_cached(url, params, use_cache)
+        if body is not None:
+            return body
+        if cls.OFFLINE_METADATA:
+            return json.dumps(OFFLINE_METADATA_ERROR)
+
+        headers = header_fn() if header_fn else cls.get_auth_header()
+        response = HttpClient.get(url, headers=headers, params=params, replayable=True)
+        if cls._is_unauthorized(response, headers):
+            # a token can be revoked before it expires, try once more with a new one
+            headers = header_fn() if header_fn else cls.get_auth_header()
+            response = HttpClient.get(url, headers=headers, params=params, replayable=True)
+        cls._put_cached(cache_key, url, response)
+        return response.text
+
+    @classmethod
+    async def fetch_async(cls, url, params=None, header_fn=None, use_cache=True) -> str:
+        """ Coroutine version of fetch, must run on the AsyncHttpClient event loop """
+        # sqlite and a token refresh block, they run on worker threads so the loop keeps
+        # serving the other requests in flight
+        loop = asyncio.get_running_loop()
+        cache_key, body = await loop.run_in_executor(None, cls._get_cached, url, params, use_cache)
+        if body is not None:
+            return body
+        if cls.OFFLINE_METADATA:
+            return json.dumps(OFFLINE_METADATA_ERROR)
+
+        headers = await loop.run_in_executor(None, header_fn or cls.get_auth_header)
+        response = await AsyncHttpClient.get(url, headers=headers, params=params, replayable=True)
+        if await loop.run_in_executor(None, cls._is_unauthorized, response, headers):
+            headers = await loop.run_in_executor(None, header_fn or cls.get_auth_header)
+            response = await AsyncHttpClient.get(url, headers=headers, params=params, replayable=True)
+        await loop.run_in_executor(None, cls._put_cached, cache_key, url, response)
+        return response.text
+
     @classmethod
     def invoke_url_with_params(cls, url, limit, offset, **kwargs):
-        headers, params = cls.get_auth_header_and_params(limit=limit, offset=offset)
+        params = {LIMIT: limit, OFFSET: offset}
         params.update(kwargs)
-        return requests.get(url, headers=headers, params=params).json()
+        return json.loads(cls.fetch(url, params=params,
+                                    header_fn=lambda: cls.get_auth_header_and_params(limit=limit, offset=offset)[0]))
 
     @classmethod
-    def invoke_url(cls, url, tryCount=0):
-        # we need to import that here, otherwise we will get circular imports!
-        from zotify.termoutput import Printer, PrintChannel
-        headers = cls.get_auth_header()
-        response = requests.get(url, headers=headers)
-        responsetext = response.text
+    def invoke_page(cls, url, limit, offset, tryCount=0, use_cache=True, **kwargs) -> dict:
+        """ Returns one page of a listing, sent again on API errors like invoke_url """
+        params = {LIMIT: limit, OFFSET: offset}
+        params.update(kwargs)
+        responsejson = cls._parse_response(cls.fetch(url, params=params,
+                                                     header_fn=lambda: cls.get_auth_header_and_params(limit=limit, offset=offset)[0],
+                                                     use_cache=use_cache))
+        if cls._should_retry(responsejson, tryCount):
+            return cls.invoke_page(url, limit, offset, tryCount + 1, use_cache, **kwargs)
+        return responsejson
+
+    @classmethod
+    async def invoke_page_async(cls, url, limit, offset, tryCount=0, use_cache=True, **kwargs) -> dict:
+        params = {LIMIT: limit, OFFSET: offset}
+        params.update(kwargs)
+        responsejson = cls._parse_response(await cls.fetch_async(url, params=params,
+                                                                 header_fn=lambda: cls.get_auth_header_and_params(limit=limit, offset=offset)[0],
+                                                                 use_cache=use_cache))
+        if cls._should_retry(responsejson, tryCount):
+            return await cls.invoke_page_async(url, limit, offset, tryCount + 1, use_cache, **kwargs)
+        return responsejson
+
+    @classmethod
+    async def _gather(cls, coros) -> list:
+        return list(await asyncio.gather(*coros))
+
+    @classmethod
+    def invoke_url_paginated(cls, url, limit, use_cache=True, **kwargs) -> list:
+        """ Returns the items of all pages of url, fetching every page after the first concurrently """
+        resp = cls.invoke_page(url, limit=limit, offset=0, use_cache=use_cache, **kwargs)
+        items = list(resp[ITEMS])
+        total = resp.get(TOTAL)
+
+        if total is None:
+            # no total to plan with, walk the pages one by one
+            offset = limit
+            while len(resp[ITEMS]) == limit:
+                resp = cls.invoke_page(url, limit=limit, offset=offset, use_cache=use_cache, **kwargs)
+                items.extend(resp[ITEMS])
+                offset += limit
+            return items
+
+        offsets = range(limit, total, limit)
+        if len(offsets) > 0 and AsyncHttpClient.is_enabled():
+            # every page is in flight at once, ASYNC_API_CONCURRENCY bounds the requests on the wire
+            for page in AsyncHttpClient.run(cls._gather(cls.invoke_page_async(url, limit=limit, offset=offset, use_cache=use_cache, **kwargs)
+                                                        for offset in offsets)):
+                items.extend(page[ITEMS])
+        elif len(offsets) > 0:
+            with ThreadPoolExecutor(max_workers=cls.CONFIG.get_pagination_window()) as executor:
+                # map yields the pages in offset order no matter which one finishes first
+                for page in executor.map(lambda offset: cls.invoke_page(url, limit=limit, offset=offset, use_cache=use_cache, **kwargs), offsets):
+                    items.extend(page[ITEMS])
+        return items
+
+    @classmethod
+    def invoke_urls(cls, urls) -> list:
+        """ Invokes several urls at the same time, results keep the order of urls """
+        if AsyncHttpClient.is_enabled():
+            # the requests share multiplexed HTTP/2 connections, ASYNC_API_CONCURRENCY bounds them
+            return AsyncHttpClient.run(cls._gather(cls.invoke_url_async(url) for url in urls))
+        with ThreadPoolExecutor(max_workers=cls.CONFIG.get_pagination_window()) as executor:
+            return list(executor.map(cls.invoke_url, urls))
+
+    @classmethod
+    def _parse_response(cls, responsetext) -> dict:
         try:
-            responsejson = response.json()
+            return json.loads(responsetext)
         except json.decoder.JSONDecodeError:
-            responsejson = {"error": {"status": "unknown", "message": "received an empty response"}}
+            return {"error": {"status": "unknown", "message": "received an empty response"}}
 
-        if not responsejson or 'error' in responsejson:
-            if tryCount < (cls.CONFIG.get_retry_attempts() - 1):
-                Printer.print(PrintChannel.WARNINGS, f"Spotify API Error (try {tryCount + 1}) ({responsejson['error']['status']}): {responsejson['error']['message']}")
-                time.sleep(5)
-                return cls.invoke_url(url, tryCount + 1)
+    @classmethod
+    def _should_retry(cls, responsejson, tryCount) -> bool:
+        """ Reports API errors and tells whether the request should be sent again """
+        # we need to import that here, otherwise we will get circular imports!
+        from zotify.termoutput import Printer, PrintChannel
+        if responsejson and 'error' not in responsejson:
+            return False
 
-            Printer.print(PrintChannel.API_ERRORS, f"Spotify API Error ({responsejson['error']['status']}): {responsejson['error']['message']}")
+        if tryCount < (cls.CONFIG.get_retry_attempts() - 1) and not cls.OFFLINE_METADATA:
+            Printer.print(PrintChannel.WARNINGS, f"Spotify API Error (try {tryCount + 1}) ({responsejson['error']['status']}): {responsejson['error']['message']}")
+            # no fixed pause here, the rate limiter already backs off and honours Retry-After
+            return True
 
+        Printer.print(PrintChannel.API_ERRORS, f"Spotify API Error ({responsejson['error']['status']}): {responsejson['error']['message']}")
+        return False
+
+    @classmethod
+    def invoke_url(cls, url, tryCount=0, use_cache=True):
+        responsetext = cls.fetch(url, use_cache=use_cache)
+        responsejson = cls._parse_response(responsetext)
+        if cls._should_retry(responsejson, tryCount):
+            return cls.invoke_url(url, tryCount + 1, use_cache)
+        return responsetext, responsejson
+
+    @classmethod
+    async def invoke_url_async(cls, url, tryCount=0, use_cache=True):
+        responsetext = await cls.fetch_async(url, use_cache=use_cache)
+        responsejson = cls._parse_response(responsetext)
+        if cls._should_retry(responsejson, tryCount):
+            return await cls.invoke_url_async(url, tryCount + 1, use_cache)
         return responsetext, responsejson
 
     @classmethod
     def check_premium(cls) -> bool:
         """ If user has spotify premium return true """
+        if cls.SESSION is None:
+            return False
         return (cls.SESSION.get_user_attribute(TYPE) == PREMIUM)